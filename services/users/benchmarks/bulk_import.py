@@ -0,0 +1,71 @@
+"""Compare bulk user import with one-request-per-user creation.
+
+Usage: python -m benchmarks.bulk_import --rows 20000 --rounds 4
+
+Both paths hash every password at the given bcrypt cost; the single-row
+path is measured on a sample and extrapolated.
+"""
+import argparse
+import io
+import json
+
+from benchmarks.common import create_bench_app, drop_db, reset_db, timed
+from project import db
+from project.api.importer import import_users, read_records
+from project.api.models import User
+
+
+def ndjson_source(start, count):
+    lines = (
+        json.dumps({"username": f"bulk{i}", "email": f"bulk{i}@example.com", "password": "pw"})
+        for i in range(start, start + count)
+    )
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def single_row(start, count):
+    for i in range(start, start + count):
+        db.session.add(User(f"single{i}", f"single{i}@example.com", "pw"))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--sample", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    app.config["BCRYPT_LOG_ROUNDS"] = args.rounds
+    app.config["HASHING_WORKERS"] = args.workers
+    with app.app_context():
+        reset_db()
+        try:
+            _, elapsed = timed(single_row, 0, args.sample)
+            print(f"single-row: {args.sample / elapsed:,.0f} rows/s ({args.sample} rows)")
+
+            source = ndjson_source(0, args.rows)
+            report, elapsed = timed(
+                import_users, read_records(source, "ndjson"), batch_size=args.batch_size
+            )
+            print(
+                f"      bulk: {args.rows / elapsed:,.0f} rows/s ({report['inserted']} rows, "
+                f"batch {args.batch_size}, {args.workers} hashing workers)"
+            )
+
+            source = ndjson_source(0, args.rows)
+            report, elapsed = timed(
+                import_users, read_records(source, "ndjson"), batch_size=args.batch_size
+            )
+            print(
+                f" conflicts: {args.rows / elapsed:,.0f} rows/s ({report['failed']} skipped)"
+            )
+        finally:
+            drop_db()
+
+
+if __name__ == "__main__":
+    main()
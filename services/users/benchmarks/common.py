@@ -0,0 +1,59 @@
+import os
+import resource
+import time
+
+from project import create_app, db, bcrypt
+from project.api.importer import copy_users, synthetic_users
+
+BENCH_PASSWORD = "greaterthaneight"
+
+
+def create_bench_app():
+    app = create_app()
+    app.config.from_object("project.config.TestingConfig")
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "DATABASE_BENCH_URL", app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    return app
+
+
+def reset_db():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.commit()
+
+
+def drop_db():
+    db.session.remove()
+    db.drop_all()
+
+
+def seed_users(count, rounds=4):
+    # one shared hash keeps seeding cheap; every user's password is BENCH_PASSWORD
+    password = bcrypt.generate_password_hash(BENCH_PASSWORD, rounds).decode()
+    copy_users(synthetic_users(count, password))
+
+
+def current_rss_kb():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() // 1024
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
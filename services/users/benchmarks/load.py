@@ -0,0 +1,281 @@
+"""Load test the users service and compare the results against a stored baseline.
+
+Usage: python -m benchmarks.load --users 10000 --concurrency 8 --duration 10 \\
+    --output bench.json --baseline benchmarks/baseline.json
+   or: python manage.py bench <same options>
+
+The service is served by gunicorn (configured through gunicorn_config.py)
+in a subprocess running ProductionConfig against the benchmark database,
+seeded with --users users. Every scenario is warmed up, then driven for
+--duration seconds by --concurrency keep-alive client threads. Throughput, p50/p95/p99 and
+errors per scenario are written to --output as JSON. With --baseline, each
+scenario is compared against the stored numbers and the run fails when
+throughput drops or p95 grows by more than --tolerance;
+--save-baseline stores the current run as the new baseline.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import (
+    BENCH_PASSWORD,
+    create_bench_app,
+    drop_db,
+    percentile,
+    reset_db,
+    seed_users,
+)
+from benchmarks.serving import serve, wait_for
+from project import db
+from project.api.models import User
+
+
+def list_users(rng, worker, i, context):
+    return "GET", "/users?limit=100", None, {}, 200
+
+
+def get_user(rng, worker, i, context):
+    return "GET", f"/users/{rng.choice(context['ids'])}", None, {}, 200
+
+
+def register(rng, worker, i, context):
+    name = f"load-{worker}-{i}"
+    body = {"username": name, "email": f"{name}@example.com", "password": BENCH_PASSWORD}
+    return "POST", "/auth/register", body, {}, 201
+
+
+def login(rng, worker, i, context):
+    body = {"email": f"user{rng.randrange(context['users'])}@example.com",
+            "password": BENCH_PASSWORD}
+    return "POST", "/auth/login", body, {}, 200
+
+
+def status(rng, worker, i, context):
+    headers = {"Authorization": f"Bearer {rng.choice(context['tokens'])}"}
+    return "GET", "/auth/status", None, headers, 200
+
+
+SCENARIOS = {
+    "users": list_users,
+    "user": get_user,
+    "register": register,
+    "login": login,
+    "status": status,
+}
+
+
+def drive(port, scenario, context, concurrency, duration, seed=0, phase="run"):
+    latencies, errors = [], Counter()
+    deadline = time.perf_counter() + duration
+
+    def client(worker):
+        rng = random.Random(seed * 1000 + worker)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        worker = f"{phase}{worker}"
+        i = 0
+        while time.perf_counter() < deadline:
+            method, path, body, headers, expected = scenario(rng, worker, i, context)
+            i += 1
+            if body is not None:
+                body = json.dumps(body)
+                headers = dict(headers, **{"Content-Type": "application/json"})
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != expected:
+                    errors[str(response.status)] += 1
+            except (OSError, http.client.HTTPException):
+                errors["connection"] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "errors": dict(errors),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:>10}: no baseline")
+            continue
+        throughput = _change(result["throughput"], base["throughput"])
+        p95 = _change(result["p95_ms"], base["p95_ms"])
+        regressed = throughput < -tolerance or p95 > tolerance
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:>10}: throughput {throughput:+.1%}, p95 {p95:+.1%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def _change(value, base):
+    return (value - base) / base if base else 0.0
+
+
+def run(
+    users=10000,
+    concurrency=8,
+    duration=10.0,
+    warmup=1.0,
+    scenarios=None,
+    rounds=None,
+    worker_class="sync",
+    workers=2,
+    port=5098,
+    seed=0,
+):
+    scenarios = scenarios or list(SCENARIOS)
+    app = create_bench_app()
+    app.config["TOKEN_EXPIRATION_DAYS"] = 1
+    app.config["ACCESS_TOKEN_EXPIRATION_SECONDS"] = 86400
+    if rounds is None:
+        from project.config import ProductionConfig
+
+        rounds = ProductionConfig.BCRYPT_LOG_ROUNDS
+    with app.app_context():
+        reset_db()
+        seed_users(users, rounds=rounds)
+        ids = [row.id for row in db.session.query(User.id)]
+        sample = random.Random(seed).sample(ids, min(len(ids), 100))
+        tokens = [
+            user.encode_auth_token(user.id).decode()
+            for user in User.query.filter(User.id.in_(sample))
+        ]
+        database_url = str(db.engine.url)
+        db.engine.dispose()
+    context = {"users": users, "ids": ids, "tokens": tokens}
+
+    env = dict(
+        os.environ,
+        APP_SETTINGS="project.config.ProductionConfig",
+        DATABASE_URL=database_url,
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_WORKERS=str(workers),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load", "--serve", "--port", str(port),
+         "--rounds", str(rounds)],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        wait_for(port)
+        for name in scenarios:
+            scenario = SCENARIOS[name]
+            if warmup:
+                drive(port, scenario, context, concurrency, warmup, seed, phase="warmup")
+            result = drive(port, scenario, context, concurrency, duration, seed)
+            results[name] = result
+            print(
+                f"{name:>10}: {result['throughput']:,.0f} req/s, "
+                f"p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, "
+                f"p99 {result['p99_ms']:.1f}ms, errors {sum(result['errors'].values())}"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+        with app.app_context():
+            drop_db()
+    return {
+        "settings": {
+            "users": users,
+            "concurrency": concurrency,
+            "duration": duration,
+            "warmup": warmup,
+            "bcrypt_log_rounds": rounds,
+            "worker_class": worker_class,
+            "workers": workers,
+            "seed": seed,
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1, help="unmeasured seconds first")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--rounds", type=int, help="bcrypt cost; ProductionConfig's if unset")
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        # the login scenario repeats a handful of emails from one address
+        config = {"BCRYPT_LOG_ROUNDS": args.rounds, "LOGIN_RATE_LIMIT_ENABLED": False}
+        return serve(args.port, config)
+
+    report = run(
+        users=args.users,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        warmup=args.warmup,
+        scenarios=args.scenarios.split(","),
+        rounds=args.rounds,
+        worker_class=args.worker_class,
+        workers=args.workers,
+        port=args.port,
+        seed=args.seed,
+    )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; store one with --save-baseline")
+        return 0
+    with open(args.baseline) as stored:
+        baseline = json.load(stored)
+    if baseline["settings"] != report["settings"]:
+        print(f"Baseline settings differ: {baseline['settings']}")
+    return 1 if compare(report["results"], baseline["results"], args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
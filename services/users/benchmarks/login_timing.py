@@ -0,0 +1,83 @@
+"""Login latency for a valid login, a wrong password and an unknown email.
+
+Usage: python -m benchmarks.login_timing --rounds 10 --samples 50 --tolerance 0.2
+
+Unknown emails are checked against a dummy hash of the configured cost, so
+all three cases should take about as long. The run exits non-zero when the
+median of the slowest case is more than --tolerance above the fastest.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import (
+    BENCH_PASSWORD,
+    create_bench_app,
+    drop_db,
+    percentile,
+    reset_db,
+    seed_users,
+)
+
+CASES = {
+    "valid": ("user0@example.com", BENCH_PASSWORD, 200),
+    "wrong password": ("user0@example.com", "wrongpassword", 404),
+    "unknown email": ("nobody@example.com", BENCH_PASSWORD, 404),
+}
+
+
+def login(client, email, password, expected):
+    body = json.dumps({"email": email, "password": password})
+    start = time.perf_counter()
+    response = client.post("/auth/login", data=body, content_type="application/json")
+    elapsed = time.perf_counter() - start
+    if response.status_code != expected:
+        raise SystemExit(f"{email}: expected {expected}, got {response.status_code}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10, help="BCRYPT_LOG_ROUNDS")
+    parser.add_argument("--samples", type=int, default=50, help="per case")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    app.config.update(
+        BCRYPT_LOG_ROUNDS=args.rounds,
+        HASHING_EXECUTOR="inline",
+        LOGIN_RATE_LIMIT_ENABLED=False,
+    )
+    with app.app_context():
+        reset_db()
+        seed_users(1, args.rounds)
+    try:
+        client = app.test_client()
+        latencies = {name: [] for name in CASES}
+        # the first miss pays for hashing the dummy password
+        for case in CASES.values():
+            login(client, *case)
+        # interleaved, so that drift affects every case alike
+        for _ in range(args.samples):
+            for name, case in CASES.items():
+                latencies[name].append(login(client, *case))
+    finally:
+        with app.app_context():
+            drop_db()
+
+    medians = {}
+    for name, samples in latencies.items():
+        medians[name] = percentile(samples, 50)
+        print(
+            f"{name:>14}: p50 {medians[name] * 1000:.2f}ms, "
+            f"p95 {percentile(samples, 95) * 1000:.2f}ms"
+        )
+    spread = max(medians.values()) / min(medians.values()) - 1
+    print(f"{'spread':>14}: {spread:.1%} (tolerance {args.tolerance:.0%})")
+    return 1 if spread > args.tolerance else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
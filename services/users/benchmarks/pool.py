@@ -0,0 +1,84 @@
+"""Connection pool load test against a local Postgres.
+
+Usage: python -m benchmarks.pool --threads 32 --requests 200 --pool-sizes 2,5,10
+
+Every thread drives GET /users?limit=50 through its own test client; for
+each pool size the run reports throughput, latency percentiles and the
+time requests spent waiting to check a connection out of the pool.
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import create_bench_app, drop_db, percentile, reset_db, seed_users
+from project import db
+
+
+def worker(app, requests, latencies, errors):
+    client = app.test_client()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get("/users?limit=50")
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+def run(pool_size, overflow, pgbouncer, args):
+    app = create_bench_app()
+    app.config.update(
+        SQLALCHEMY_POOL_SIZE=pool_size,
+        SQLALCHEMY_MAX_OVERFLOW=overflow,
+        SQLALCHEMY_PGBOUNCER=pgbouncer,
+        SQLALCHEMY_POOL_TIMEOUT=args.pool_timeout,
+    )
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=worker, args=(app, args.requests, latencies, errors))
+        for _ in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        metrics = db.pool_metrics()
+        db.engine.dispose()
+    mode = "pgbouncer" if pgbouncer else "session"
+    print(
+        f"pool {pool_size:>3}+{overflow:<3} {mode:>9}: {len(latencies) / elapsed:,.0f} req/s, "
+        f"p50 {percentile(latencies, 50) * 1000:.1f}ms, "
+        f"p99 {percentile(latencies, 99) * 1000:.1f}ms, errors {len(errors)}, "
+        f"checkout wait avg {metrics['wait_total_ms'] / max(metrics['checkouts'], 1):.2f}ms "
+        f"max {metrics['wait_max_ms']:.1f}ms, timeouts {metrics['timeouts']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="per thread")
+    parser.add_argument("--pool-sizes", default="2,5,10")
+    parser.add_argument("--overflow", type=int, default=0)
+    parser.add_argument("--pool-timeout", type=int, default=30)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        reset_db()
+        seed_users(args.users)
+        db.engine.dispose()
+    try:
+        for pool_size in [int(size) for size in args.pool_sizes.split(",")]:
+            for pgbouncer in (False, True):
+                run(pool_size, args.overflow, pgbouncer, args)
+    finally:
+        with app.app_context():
+            drop_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Compare gunicorn worker classes on /users/ping, /users/<id> and /auth/status.
+
+Usage: python -m benchmarks.serving --worker-classes sync,gevent --workers 2
+
+Each worker class is served by gunicorn (configured through
+gunicorn_config.py) in a subprocess running ProductionConfig against the
+benchmark database, and driven by keep-alive client threads.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import create_bench_app, drop_db, percentile, reset_db, seed_users
+from project import db
+from project.api.models import User
+
+
+def serve(port, config=None):
+    from gunicorn.app.base import BaseApplication
+
+    import gunicorn_config
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in vars(gunicorn_config).items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+
+        def load(self):
+            from wsgi import app
+
+            app.config.update(config or {})
+            return app
+
+    Application().run()
+
+
+def drive(port, path, headers, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException):
+                errors.append("connection")
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/users/ping")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--worker-classes", default="sync,gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-connections", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.port)
+
+    app = create_bench_app()
+    app.config["TOKEN_EXPIRATION_DAYS"] = 1
+    app.config["ACCESS_TOKEN_EXPIRATION_SECONDS"] = 86400
+    with app.app_context():
+        reset_db()
+        seed_users(1000)
+        user = User.query.first()
+        token = user.encode_auth_token(user.id).decode()
+        endpoints = {
+            "/users/ping": {},
+            f"/users/{user.id}": {},
+            "/auth/status": {"Authorization": f"Bearer {token}"},
+        }
+        database_url = str(db.engine.url)
+        db.engine.dispose()
+
+    try:
+        for worker_class in args.worker_classes.split(","):
+            env = dict(
+                os.environ,
+                APP_SETTINGS="project.config.ProductionConfig",
+                DATABASE_URL=database_url,
+                GUNICORN_WORKER_CLASS=worker_class,
+                GUNICORN_WORKERS=str(args.workers),
+                GUNICORN_WORKER_CONNECTIONS=str(args.worker_connections),
+            )
+            server = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.serving", "--serve", "--port",
+                 str(args.port)],
+                env=env,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for(args.port)
+                for path, headers in endpoints.items():
+                    latencies, errors = drive(
+                        args.port, path, headers, args.concurrency, args.duration
+                    )
+                    print(
+                        f"{worker_class:>8} {path:>14}: "
+                        f"{len(latencies) / args.duration:,.0f} req/s, "
+                        f"p50 {percentile(latencies, 50) * 1000:.1f}ms, "
+                        f"p99 {percentile(latencies, 99) * 1000:.1f}ms, "
+                        f"errors {len(errors)}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        with app.app_context():
+            drop_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Signup latency under concurrency: SELECT-then-INSERT versus INSERT only.
+
+Usage: python -m benchmarks.signup --threads 8 --signups 200 --duplicates 0.2
+
+A share of the attempts reuse an already registered email, so both the
+success and the conflict paths are exercised.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import exc, or_
+
+from benchmarks.common import create_bench_app, drop_db, percentile, reset_db
+from project import db
+from project.api.models import User, unique_violation
+
+
+def select_then_insert(username, email):
+    if User.query.filter(or_(User.same_username(username), User.same_email(email))).first():
+        return "duplicate"
+    try:
+        db.session.add(User(username, email, "pw"))
+        db.session.commit()
+        return "created"
+    except exc.IntegrityError:
+        # lost the race between the SELECT and the INSERT
+        db.session.rollback()
+        return "race"
+
+
+def insert_only(username, email):
+    try:
+        db.session.add(User(username, email, "pw"))
+        db.session.commit()
+        return "created"
+    except exc.IntegrityError as e:
+        db.session.rollback()
+        return "duplicate" if unique_violation(e) else "error"
+
+
+STRATEGIES = {"select+insert": select_then_insert, "insert": insert_only}
+
+
+def worker(app, strategy, prefix, signups, duplicates, seed, latencies, outcomes):
+    rng = random.Random(seed)
+    counts = Counter()
+    with app.app_context():
+        for i in range(signups):
+            if i and rng.random() < duplicates:
+                name = f"{prefix}-{seed}-{rng.randrange(i)}"
+            else:
+                name = f"{prefix}-{seed}-{i}"
+            start = time.perf_counter()
+            outcome = strategy(name, f"{name}@example.com")
+            latencies.append(time.perf_counter() - start)
+            counts[outcome] += 1
+    outcomes.append(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--signups", type=int, default=200, help="per thread")
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    app.config["HASHING_EXECUTOR"] = "inline"
+    with app.app_context():
+        reset_db()
+    try:
+        for name, strategy in STRATEGIES.items():
+            latencies, outcomes = [], []
+            threads = [
+                threading.Thread(
+                    target=worker,
+                    args=(app, strategy, name, args.signups, args.duplicates, seed,
+                          latencies, outcomes),
+                )
+                for seed in range(args.threads)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            outcomes = dict(sum(outcomes, Counter()))
+            print(
+                f"{name:>14}: {len(latencies) / elapsed:,.0f} signups/s, "
+                f"p50 {percentile(latencies, 50) * 1000:.2f}ms, "
+                f"p99 {percentile(latencies, 99) * 1000:.2f}ms, {outcomes}"
+            )
+    finally:
+        with app.app_context():
+            drop_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Worker startup cost and the cost of running under coverage tracing.
+
+Usage: python -m benchmarks.startup --runs 5 --requests 2000
+       python -m benchmarks.startup --profile [--config DevelopmentConfig]
+
+"traced" reproduces the old production entry point, which started
+coverage before importing the app; "lean" imports wsgi.py the way
+gunicorn does now. Every measurement runs in a fresh interpreter.
+
+--profile breaks the import of wsgi.py down into the self time of each
+top-level package (python -X importtime) and per create_app step
+(STARTUP_PROFILE=1).
+"""
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import create_bench_app, drop_db, reset_db, seed_users
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+if sys.argv[1] == "traced":
+    import coverage
+    cov = coverage.coverage(
+        branch=True, include="project/*", omit=["project/tests/*", "project/config.py"]
+    )
+    cov.start()
+from wsgi import app
+startup = time.perf_counter() - start
+app.config.from_object("project.config.TestingConfig")
+client = app.test_client()
+timings = {}
+for path in ("/users/ping", "/users/1"):
+    client.get(path)
+    start = time.perf_counter()
+    for _ in range(int(sys.argv[2])):
+        client.get(path)
+    timings[path] = (time.perf_counter() - start) / int(sys.argv[2])
+print(json.dumps({"startup": startup, "requests": timings}))
+"""
+
+
+def probe(mode, requests):
+    output = subprocess.check_output([sys.executable, "-c", PROBE, mode, str(requests)])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def profile_imports(config):
+    env = dict(os.environ, APP_SETTINGS=f"project.config.{config}", STARTUP_PROFILE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wsgi"],
+        env=env,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    packages = collections.Counter()
+    for line in result.stderr.decode().splitlines():
+        if line.startswith("import time:") and "|" in line:
+            self_time, _, name = line[len("import time:"):].split("|")
+            if self_time.strip().isdigit():
+                packages[name.strip().split(".")[0]] += int(self_time)
+        elif line.startswith("startup:"):
+            print(line)
+    for package, micros in packages.most_common(15):
+        print(f"import: {package:<33} {micros / 1000:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--config", default="ProductionConfig")
+    args = parser.parse_args()
+    if args.profile:
+        return profile_imports(args.config)
+
+    app = create_bench_app()
+    with app.app_context():
+        reset_db()
+        seed_users(1)
+    try:
+        for mode in ("traced", "lean"):
+            results = [probe(mode, args.requests) for _ in range(args.runs)]
+            startup = min(result["startup"] for result in results)
+            line = f"{mode:>6}: startup {startup * 1000:.0f}ms"
+            for path in results[0]["requests"]:
+                per_request = min(result["requests"][path] for result in results)
+                line += f", {path} {per_request * 1e6:.0f}us/req"
+            print(line)
+    finally:
+        with app.app_context():
+            drop_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare full ORM hydration with column-projected rows for user listings.
+
+Usage: python -m benchmarks.user_listing --rows 100000
+
+Every variant runs in a fresh interpreter so that peak RSS is measured
+in isolation.
+"""
+import argparse
+import json
+import multiprocessing
+
+from benchmarks.common import (
+    create_bench_app,
+    current_rss_kb,
+    drop_db,
+    peak_rss_kb,
+    reset_db,
+    seed_users,
+    timed,
+)
+
+
+def orm_listing():
+    from project.api.models import User
+
+    return [user.to_json() for user in User.query.all()]
+
+
+def projected_listing():
+    from project.api.models import User
+
+    return [User.row_to_json(row) for row in User.json_query()]
+
+
+VARIANTS = {"orm": orm_listing, "projected": projected_listing}
+
+
+def run_variant(name, repeat, results):
+    app = create_bench_app()
+    with app.app_context():
+        baseline_rss = current_rss_kb()
+        best = None
+        for _ in range(repeat):
+            users, elapsed = timed(VARIANTS[name])
+            json.dumps({"status": "success", "data": {"users": users}})
+            best = elapsed if best is None else min(best, elapsed)
+            del users
+        results.put(
+            {
+                "variant": name,
+                "rows": len(VARIANTS[name]()),
+                "seconds": best,
+                "peak_rss_delta_kb": peak_rss_kb() - baseline_rss,
+            }
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        reset_db()
+        seed_users(args.rows)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    try:
+        for name in VARIANTS:
+            process = ctx.Process(target=run_variant, args=(name, args.repeat, results))
+            process.start()
+            result = results.get()
+            process.join()
+            print(
+                "{variant:>10}: {rows} rows in {seconds:.3f}s "
+                "({rate:,.0f} rows/s), peak RSS +{peak_rss_delta_kb:,} KiB".format(
+                    rate=result["rows"] / result["seconds"], **result
+                )
+            )
+    finally:
+        with app.app_context():
+            drop_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,4 +8,4 @@ done
 
 echo "PostgreSQL started"
 
-gunicorn -b 0.0.0.0:5000 manage:app
\ No newline at end of file
+gunicorn -c gunicorn_config.py wsgi:app
\ No newline at end of file
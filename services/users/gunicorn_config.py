@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 2))
+
+if worker_class == "gevent":
+    # bcrypt must not run on the event loop: hash on real OS threads instead
+    os.environ.setdefault("HASHING_EXECUTOR", "gevent")
+
+if os.environ.get("BCRYPT_TARGET_MS") and "BCRYPT_LOG_ROUNDS" not in os.environ:
+    # calibrate once, in the master, so that every worker hashes at the same
+    # cost. project.config reads BCRYPT_LOG_ROUNDS when it is first imported,
+    # so it must not be imported before the result is exported
+    from project.hashing import calibrate_log_rounds
+
+    os.environ["BCRYPT_LOG_ROUNDS"] = str(
+        calibrate_log_rounds(
+            float(os.environ["BCRYPT_TARGET_MS"]),
+            int(os.environ.get("BCRYPT_MIN_LOG_ROUNDS", 10)),
+            int(os.environ.get("BCRYPT_MAX_LOG_ROUNDS", 16)),
+        )
+    )
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # make psycopg2 yield to the hub while waiting on Postgres
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+
+
+def when_ready(server):
+    if "BCRYPT_TARGET_MS" in os.environ:
+        server.log.info("Hashing with BCRYPT_LOG_ROUNDS=%s", os.environ["BCRYPT_LOG_ROUNDS"])
+    pool = int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5))
+    overflow = int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 10))
+    server.log.info(
+        "Serving with %d %s workers; up to %d Postgres connections",
+        workers,
+        worker_class,
+        workers * (pool + overflow),
+    )
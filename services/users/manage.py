@@ -1,17 +1,35 @@
+import os
+import sys
+import time
 import unittest
 
+import click
+from flask import current_app
 from flask.cli import FlaskGroup
-import coverage
 
-from project import create_app, db
-from project.api.models import User
+# coverage is only wanted for the cov command; it has to start before the
+# project modules below are imported so their import-time lines are counted
+COV = None
+if sys.argv[1:2] == ["cov"]:
+    import coverage
+
+    COV = coverage.coverage(
+        branch=True, include="project/*", omit=["project/tests/*", "project/config.py"]
+    )
+    COV.start()
 
-COV = coverage.coverage(
-    branch=True, include="project/*", omit=["project/tests/*", "project/config.py"]
+from project import create_app, db, hasher
+from project.api.importer import (
+    UnreadableSource,
+    copy_users,
+    import_users as import_user_records,
+    read_records,
+    synthetic_users,
 )
-COV.start()
+from project.api.models import User
+from project.hashing import calibrate_log_rounds
+from project.signing import generate_private_key
 
-app = create_app
 cli = FlaskGroup(create_app=create_app)
 
 
@@ -28,11 +46,27 @@ def test():
     result = unittest.TextTestRunner(verbosity=2).run(tests)
     if result.wasSuccessful():
         return 0
-    return 1
+    # click ignores return values, so the exit status has to be set explicitly
+    sys.exit(1)
 
 
 @cli.command()
-def seed_db():
+@click.option("--count", type=int, help="load COUNT synthetic users through COPY")
+@click.option("--start", type=int, default=0, help="number of the first synthetic user")
+@click.option("--rounds", type=int, help="bcrypt cost of the shared hash")
+@click.option("--password", default="greaterthaneight")
+def seed_db(count, start, rounds, password):
+    if count:
+        # every synthetic user shares one hash, so seeding is bound by COPY alone
+        start_time = time.perf_counter()
+        password_hash = hasher.generate_password_hash(password, rounds)
+        loaded = copy_users(synthetic_users(count, password_hash, start))
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"Seeded {loaded} users (user{start}..user{start + count - 1}) in {elapsed:.2f}s "
+            f"({loaded / elapsed if elapsed else 0:,.0f} rows/s)"
+        )
+        return
     db.session.add(
         User(username="michael", email="hermanmu@gmail.com", password="greaterthaneight")
     )
@@ -44,6 +78,58 @@ def seed_db():
     db.session.commit()
 
 
+@cli.command()
+@click.option("--target-ms", type=float, default=250, help="time to spend on one hash")
+def calibrate_bcrypt(target_ms):
+    config = current_app.config
+    rounds = calibrate_log_rounds(
+        target_ms, config["BCRYPT_MIN_LOG_ROUNDS"], config["BCRYPT_MAX_LOG_ROUNDS"]
+    )
+    print(f"BCRYPT_LOG_ROUNDS={rounds}")
+
+
+@cli.command()
+@click.argument("source", type=click.File("rb"))
+@click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]), default="ndjson")
+def import_users(source, fmt):
+    start = time.perf_counter()
+    try:
+        report = import_user_records(read_records(source, fmt))
+    except UnreadableSource as e:
+        # batches before the unreadable line are already committed
+        print(f"Stopped at unreadable input: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    total = report["inserted"] + report["failed"]
+    for error in report["errors"]:
+        print(f"line {error['line']}: {error['message']}")
+    print(
+        f"Imported {report['inserted']} of {total} users in {elapsed:.2f}s "
+        f"({total / elapsed if elapsed else 0:,.0f} rows/s), {report['failed']} failed"
+    )
+
+
+# options are passed through to benchmarks.load
+@cli.command(context_settings={"ignore_unknown_options": True}, add_help_option=False)
+@click.argument("args", nargs=-1, type=click.UNPROCESSED)
+def bench(args):
+    from benchmarks.load import main
+
+    sys.exit(main(list(args)))
+
+
+@cli.command()
+@click.argument("kid")
+@click.option("--directory", envvar="JWT_KEY_DIR", required=True, help="default: JWT_KEY_DIR")
+@click.option("--bits", type=int, default=2048)
+def generate_signing_key(kid, directory, bits):
+    path = os.path.join(directory, f"{kid}.pem")
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as pem:
+        pem.write(generate_private_key(bits))
+    print(f"Wrote {path}; sign with it by setting JWT_SIGNING_KID={kid}")
+
+
 @cli.command()
 def cov():
     tests = unittest.TestLoader().discover("project/tests")
@@ -56,7 +142,7 @@ def cov():
         COV.html_report()
         COV.erase()
         return 0
-    return 1
+    sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""add indexes for filtering users
+
+Revision ID: b8e2d4f61a93
+Revises: 7934d39f6787
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b8e2d4f61a93"
+down_revision = "7934d39f6787"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f("ix_users_created_date"), "users", ["created_date"], unique=False)
+    op.create_index(
+        "ix_users_username_pattern",
+        "users",
+        ["username"],
+        unique=False,
+        postgresql_ops={"username": "text_pattern_ops"},
+    )
+    op.create_index(
+        "ix_users_email_pattern",
+        "users",
+        ["email"],
+        unique=False,
+        postgresql_ops={"email": "text_pattern_ops"},
+    )
+    op.create_index(
+        "ix_users_inactive",
+        "users",
+        ["id"],
+        unique=False,
+        postgresql_where=sa.text("NOT active"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_inactive", table_name="users")
+    op.drop_index("ix_users_email_pattern", table_name="users")
+    op.drop_index("ix_users_username_pattern", table_name="users")
+    op.drop_index(op.f("ix_users_created_date"), table_name="users")
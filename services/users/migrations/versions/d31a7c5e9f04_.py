@@ -0,0 +1,61 @@
+"""make username and email unique regardless of case
+
+Revision ID: d31a7c5e9f04
+Revises: b8e2d4f61a93
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d31a7c5e9f04"
+down_revision = "b8e2d4f61a93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fails, naming the key, if existing rows differ only in case; those have
+    # to be merged by hand first
+    op.create_index(
+        "ix_users_username_lower",
+        "users",
+        [sa.text("lower(username) text_pattern_ops")],
+        unique=True,
+    )
+    op.create_index(
+        "ix_users_email_lower",
+        "users",
+        [sa.text("lower(email) text_pattern_ops")],
+        unique=True,
+    )
+    # both are covered by the indexes above, and only slow down writes
+    op.drop_constraint("users_username_key", "users", type_="unique")
+    op.drop_constraint("users_email_key", "users", type_="unique")
+    op.drop_index("ix_users_email_pattern", table_name="users")
+    op.drop_index("ix_users_username_pattern", table_name="users")
+    # statistics on the lower() expressions, for the planner
+    op.execute("ANALYZE users")
+
+
+def downgrade():
+    op.create_index(
+        "ix_users_username_pattern",
+        "users",
+        ["username"],
+        unique=False,
+        postgresql_ops={"username": "text_pattern_ops"},
+    )
+    op.create_index(
+        "ix_users_email_pattern",
+        "users",
+        ["email"],
+        unique=False,
+        postgresql_ops={"email": "text_pattern_ops"},
+    )
+    op.create_unique_constraint("users_email_key", "users", ["email"])
+    op.create_unique_constraint("users_username_key", "users", ["username"])
+    op.drop_index("ix_users_email_lower", table_name="users")
+    op.drop_index("ix_users_username_lower", table_name="users")
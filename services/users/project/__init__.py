@@ -2,46 +2,90 @@ import os
 
 from flask import Flask
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_debugtoolbar import DebugToolbarExtension
 from flask_bcrypt import Bcrypt
 
+from project.cache import TokenCache, UserCache
+from project.database import SQLAlchemy
+from project.denylist import TokenDenylist
+from project.hashing import PasswordHasher
+from project.metrics import Metrics
+from project.ratelimit import RateLimiter
+from project.signing import TokenSigner
+from project.startup import StartupProfile
+
 # instantiate the extensions
 db = SQLAlchemy()
-toolbar = DebugToolbarExtension()
-migrate = Migrate()
 bcrypt = Bcrypt()
+hasher = PasswordHasher()
+token_cache = TokenCache()
+user_cache = UserCache()
+denylist = TokenDenylist()
+signer = TokenSigner()
+metrics = Metrics()
+rate_limiter = RateLimiter()
 
 
 def create_app(script_info=None):
+    profile = StartupProfile(enabled=bool(os.getenv("STARTUP_PROFILE")))
 
     # instantiate the app
-    app = Flask(__name__)
+    with profile.step("Flask()"):
+        app = Flask(__name__)
 
     # enabled CORS
-    CORS(app)
+    with profile.step("CORS"):
+        CORS(app)
 
     # set config
     app_settings = os.getenv("APP_SETTINGS")
     app.config.from_object(app_settings)
 
     # setup extensions
-    db.init_app(app)
-    toolbar.init_app(app)
-    migrate.init_app(app, db)
-    bcrypt.init_app(app)
+    with profile.step("db.init_app"):
+        db.init_app(app)
+    with profile.step("bcrypt.init_app"):
+        bcrypt.init_app(app)
+    with profile.step("hasher.init_app"):
+        hasher.init_app(app)
+    with profile.step("token_cache.init_app"):
+        token_cache.init_app(app)
+    with profile.step("user_cache.init_app"):
+        user_cache.init_app(app)
+    with profile.step("denylist.init_app"):
+        denylist.init_app(app)
+    with profile.step("signer.init_app"):
+        signer.init_app(app)
+    with profile.step("metrics.init_app"):
+        metrics.init_app(app)
+    with profile.step("rate_limiter.init_app"):
+        rate_limiter.init_app(app)
+
+    # dev-only and migration-only extensions are imported on demand
+    if app.config["DEBUG_TB_ENABLED"]:
+        with profile.step("flask_debugtoolbar"):
+            from flask_debugtoolbar import DebugToolbarExtension
+
+            DebugToolbarExtension(app)
+    # the flask cli passes script_info; alembic is never needed while serving
+    if script_info is not None or app.config["MIGRATIONS_ENABLED"]:
+        with profile.step("flask_migrate"):
+            from flask_migrate import Migrate
+
+            Migrate(app, db)
 
     # register blueprints
-    from project.api.users import users_blueprint
-    from project.api.auth import auth_blueprint
+    with profile.step("import blueprints"):
+        from project.api.users import users_blueprint
+        from project.api.auth import auth_blueprint
 
-    app.register_blueprint(users_blueprint)
-    app.register_blueprint(auth_blueprint)
+    with profile.step("register blueprints"):
+        app.register_blueprint(users_blueprint)
+        app.register_blueprint(auth_blueprint)
 
     # register context for flask cli
     @app.shell_context_processor
     def ctx():
         return {"app": app, "db": db}
 
+    profile.report()
     return app
@@ -1,8 +1,10 @@
-from flask import Blueprint, jsonify, request
-from sqlalchemy import exc, or_
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import exc
 
-from project.api.models import User
-from project import db, bcrypt
+from project.api.models import RevokedToken, User, unique_violation
+from project.api.utils import service_busy, too_many_requests
+from project import db, hasher, rate_limiter, signer, token_cache, user_cache
+from project.hashing import HashingPoolSaturated
 
 auth_blueprint = Blueprint("auth", __name__)
 
@@ -20,23 +22,32 @@ def register_user():
     password = post_data.get("password")
 
     try:
-        user = User.query.filter(or_(User.username == username, User.email == email)).first()
-        if not user:
-            new_user = User(username=username, email=email, password=password)
-            db.session.add(new_user)
-            db.session.commit()
-
-            auth_token = new_user.encode_auth_token(new_user.id)
-            response_object["status"] = "success"
-            response_object["message"] = "Successfully registered."
-            response_object["auth_token"] = auth_token.decode()
-            return jsonify(response_object), 201
-        else:
+        # the unique constraints detect duplicates, saving a SELECT round trip
+        new_user = User(username=username, email=email, password=password)
+        db.session.add(new_user)
+        db.session.flush()
+        # issue the tokens before commit expires the instance and forces a reload
+        sid = User.new_session_id()
+        auth_token = new_user.encode_auth_token(new_user.id, sid)
+        refresh_token = new_user.encode_refresh_token(new_user.id, sid)
+        db.session.commit()
+
+        response_object["status"] = "success"
+        response_object["message"] = "Successfully registered."
+        response_object["auth_token"] = auth_token.decode()
+        response_object["refresh_token"] = refresh_token.decode()
+        return jsonify(response_object), 201
+    except exc.IntegrityError as e:
+        db.session.rollback()
+        if unique_violation(e):
             response_object["message"] = "Sorry. That user already exists."
-            return jsonify(response_object), 400
-    except (exc.IntegrityError, ValueError):
+        return jsonify(response_object), 400
+    except ValueError:
         db.session.rollback()
         return jsonify(response_object), 400
+    except HashingPoolSaturated:
+        db.session.rollback()
+        return service_busy(response_object)
 
 
 @auth_blueprint.route("/auth/login", methods=["POST"])
@@ -50,18 +61,36 @@ def login_user():
     email = post_data.get("email")
     password = post_data.get("password")
 
+    # throttled before any query or hash, so a burst of guesses costs nothing
+    retry_after = rate_limiter.check_login(email)
+    if retry_after:
+        return too_many_requests(response_object, retry_after)
+
     try:
-        user = User.query.filter_by(email=email).first()
-        if user and bcrypt.check_password_hash(user.password, password):
-            auth_token = user.encode_auth_token(user.id)
-            if auth_token:
+        user = User.query.filter(User.same_email(email)).first()
+        # an unknown email costs the same hash as a wrong password, so response
+        # times do not tell which emails are registered
+        # a password that is not a string cannot match, but still costs a hash
+        if not isinstance(password, str):
+            password = ""
+        if user is None:
+            hasher.check_password_hash(hasher.dummy_hash(), password)
+        if user and hasher.check_password_hash(user.password, password):
+            user.rehash_password(password)
+            sid = User.new_session_id()
+            auth_token = user.encode_auth_token(user.id, sid)
+            refresh_token = user.encode_refresh_token(user.id, sid)
+            if auth_token and refresh_token:
                 response_object["status"] = "success"
                 response_object["message"] = "Successfully logged in."
                 response_object["auth_token"] = auth_token.decode()
+                response_object["refresh_token"] = refresh_token.decode()
                 return jsonify(response_object), 200
         else:
             response_object["message"] = "User does not exist."
             return jsonify(response_object), 404
+    except HashingPoolSaturated:
+        return service_busy(response_object)
     except Exception:
         response_object["message"] = "Try again."
         return jsonify(response_object), 500
@@ -74,8 +103,11 @@ def logout_user():
 
     if auth_header:
         auth_token = auth_header.split(" ")[1]
-        resp = User.decode_auth_token(auth_token)
+        # either token of the pair revokes the session
+        resp = User.decode_auth_payload(auth_token, token_type=None)
         if not isinstance(resp, str):
+            RevokedToken.revoke(resp)
+            token_cache.revoke(auth_token)
             response_object["status"] = "success"
             response_object["message"] = "Successfully logged out."
             return jsonify(response_object), 200
@@ -86,6 +118,30 @@ def logout_user():
         return jsonify(response_object), 403
 
 
+@auth_blueprint.route("/auth/refresh", methods=["POST"])
+def refresh_auth_token():
+    auth_header = request.headers.get("Authorization")
+    response_object = {"status": "fail", "message": "Provide a valid auth token."}
+
+    if auth_header:
+        refresh_token = auth_header.split(" ")[1]
+        resp = User.decode_auth_payload(refresh_token, token_type="refresh")
+        if isinstance(resp, str):
+            response_object["message"] = resp
+            return jsonify(response_object), 401
+        # the only place the claims carried by access tokens are re-read
+        user = User.query.get(resp["sub"])
+        if not user:
+            return jsonify(response_object), 401
+        auth_token = user.encode_auth_token(user.id, resp.get("sid"))
+        response_object["status"] = "success"
+        response_object["message"] = "Successfully refreshed."
+        response_object["auth_token"] = auth_token.decode()
+        return jsonify(response_object), 200
+    else:
+        return jsonify(response_object), 403
+
+
 @auth_blueprint.route("/auth/status", methods=["GET"])
 def get_user_status():
     auth_header = request.headers.get("Authorization")
@@ -93,14 +149,25 @@ def get_user_status():
 
     if auth_header:
         auth_token = auth_header.split(" ")[1]
-        resp = User.decode_auth_token(auth_token)
+        resp = User.decode_auth_payload(auth_token)
         if not isinstance(resp, str):
-            user = User.query.filter_by(id=resp).first()
+            user = User.claims_to_json(resp) or user_cache.get(resp["sub"], User.get_json)
+            if not user:
+                return jsonify(response_object), 401
             response_object["status"] = "success"
             response_object["message"] = "Success."
-            response_object["data"] = user.to_json()
+            response_object["data"] = user
             return jsonify(response_object), 200
         response_object["message"] = resp
         return jsonify(response_object), 401
     else:
         return jsonify(response_object), 401
+
+
+@auth_blueprint.route("/auth/jwks", methods=["GET"])
+def get_jwks():
+    # public keys for services that verify access tokens themselves
+    response = current_app.response_class(signer.jwks(), mimetype="application/json")
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["JWKS_MAX_AGE"]
+    return response
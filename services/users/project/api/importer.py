@@ -0,0 +1,173 @@
+import codecs
+import csv
+import datetime as dt
+import json
+
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
+
+from project import db, hasher
+from project.api.models import User
+
+FIELDS = ("username", "email", "password")
+
+
+class UnreadableSource(Exception):
+    pass
+
+
+def parse_ndjson(lines):
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+def _refuse_nul(lines):
+    # the csv module rejects NUL before Python 3.11 and passes it on since;
+    # reject it either way
+    for line in lines:
+        if "\x00" in line:
+            raise csv.Error("line contains NUL")
+        yield line
+
+
+def parse_csv(lines):
+    reader = csv.DictReader(_refuse_nul(lines))
+    for record in reader:
+        yield reader.line_num, record
+
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv}
+
+
+def read_records(stream, fmt):
+    # past a byte that is not UTF-8 or a line the csv module rejects, the rest
+    # of the file cannot be read at all
+    try:
+        yield from PARSERS[fmt](codecs.iterdecode(stream, "utf-8"))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise UnreadableSource(str(e)) from e
+
+
+def validate(record):
+    if not isinstance(record, dict):
+        return "Invalid JSON."
+    for field in FIELDS:
+        value = record.get(field)
+        if not value or not isinstance(value, str):
+            return "Invalid payload."
+        # Postgres text and bcrypt both reject NUL
+        if "\x00" in value:
+            return "Invalid payload."
+        if field != "password" and len(value) > 128:
+            return "Invalid payload."
+    return None
+
+
+def max_import_rows():
+    config = current_app.config
+    if config["BULK_IMPORT_MAX_ROWS"]:
+        return config["BULK_IMPORT_MAX_ROWS"]
+    workers = 1 if config["HASHING_EXECUTOR"] == "inline" else config["HASHING_WORKERS"]
+    rows_per_second = workers / hasher.seconds_per_hash()
+    return max(1, int(config["BULK_IMPORT_MAX_SECONDS"] * rows_per_second))
+
+
+def import_users(records, batch_size=None, max_errors=None):
+    config = current_app.config
+    batch_size = batch_size or config["BULK_IMPORT_BATCH_SIZE"]
+    max_errors = config["BULK_IMPORT_MAX_ERRORS"] if max_errors is None else max_errors
+    report = {"inserted": 0, "failed": 0, "errors": []}
+
+    def fail(line_no, message):
+        report["failed"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"line": line_no, "message": message})
+
+    batch = []
+    for line_no, record in records:
+        error = validate(record)
+        if error:
+            fail(line_no, error)
+            continue
+        batch.append((line_no, record))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, report, fail)
+            batch = []
+    if batch:
+        _insert_batch(batch, report, fail)
+    return report
+
+
+def _insert_batch(batch, report, fail):
+    passwords = hasher.generate_password_hashes(record["password"] for _, record in batch)
+    rows = [
+        {"username": record["username"], "email": record["email"], "password": password}
+        for (_, record), password in zip(batch, passwords)
+    ]
+    # rows hitting a unique constraint are skipped rather than aborting the batch
+    table = User.__table__
+    stmt = (
+        insert(table)
+        .values(rows)
+        .on_conflict_do_nothing()
+        .returning(table.c.username, table.c.email)
+    )
+    inserted = {tuple(row) for row in db.session.execute(stmt)}
+    db.session.commit()
+    report["inserted"] += len(inserted)
+    for line_no, record in batch:
+        key = (record["username"], record["email"])
+        if key in inserted:
+            # repeats of this row later in the batch conflicted with it
+            inserted.discard(key)
+        else:
+            fail(line_no, "Sorry. That user already exists.")
+
+
+COPY_COLUMNS = ("username", "email", "password", "active", "created_date")
+
+
+class _CopyStream:
+    # file-like view over rows for COPY ... FROM STDIN, encoded a chunk at a time
+    # so that arbitrarily large loads run in constant memory
+    def __init__(self, rows):
+        self.lines = ("\t".join(map(str, row)) + "\n" for row in rows)
+
+    def read(self, size=8192):
+        # psycopg2 sends whatever it is given, so chunks end on whole lines
+        chunk, length = [], 0
+        for line in self.lines:
+            chunk.append(line)
+            length += len(line)
+            if length >= size:
+                break
+        return "".join(chunk).encode()
+
+
+def copy_users(rows):
+    # rows are (username, email, password, active, created_date) tuples whose
+    # values need no escaping in COPY's text format
+    stream = _CopyStream(rows)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {User.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN", stream
+        )
+        count = cursor.rowcount
+    finally:
+        cursor.close()
+    db.session.commit()
+    return count
+
+
+def synthetic_users(count, password_hash, start=0, now=None):
+    # user<i> rows sharing one hash, created a second apart and oldest first
+    now = now or dt.datetime.utcnow()
+    for i in range(start, start + count):
+        created = now - dt.timedelta(seconds=start + count - i)
+        yield f"user{i}", f"user{i}@example.com", password_hash, "t", created.isoformat()
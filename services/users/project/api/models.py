@@ -1,28 +1,45 @@
+import calendar
 import datetime as dt
+import uuid
+from functools import partial
+from itertools import chain
 
 import jwt
 from flask import current_app
+from sqlalchemy import any_, bindparam, event, or_, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.sql import func
 
-from project import db, bcrypt
+from project import db, denylist, hasher, signer, token_cache, user_cache
+from project.metrics import timer
 
 
 class User(db.Model):  # type: ignore
     __tablename__ = "users"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    username = db.Column(db.String(128), unique=True, nullable=False)
-    email = db.Column(db.String(128), unique=True, nullable=False)
+    username = db.Column(db.String(128), nullable=False)
+    email = db.Column(db.String(128), nullable=False)
     password = db.Column(db.String(255), nullable=False)
     active = db.Column(db.Boolean(), default=True, nullable=False)
-    created_date = db.Column(db.DateTime, default=func.now(), nullable=False)
+    created_date = db.Column(db.DateTime, default=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        # unique regardless of case, and every lookup goes through lower() to
+        # use them; the pattern opclass lets LIKE 'prefix%' use them too,
+        # which the default one cannot outside the C locale
+        db.Index(
+            "ix_users_username_lower", text("lower(username) text_pattern_ops"), unique=True
+        ),
+        db.Index("ix_users_email_lower", text("lower(email) text_pattern_ops"), unique=True),
+        # inactive users are the rare ones, so only they are indexed
+        db.Index("ix_users_inactive", "id", postgresql_where=text("NOT active")),
+    )
 
     def __init__(self, username, email, password):
         self.username = username
         self.email = email
-        self.password = bcrypt.generate_password_hash(
-            password, current_app.config.get("BCRYPT_LOG_ROUNDS")
-        ).decode()
+        self.password = hasher.generate_password_hash(password)
 
     def to_json(self):
         return {
@@ -32,29 +49,252 @@ class User(db.Model):  # type: ignore
             "active": self.active,
         }
 
-    def encode_auth_token(self, user_id):
+    def rehash_password(self, password):
+        # move the stored hash to the configured cost without blocking the request
+        if hasher.needs_rehash(self.password):
+            callback = partial(User.update_password, db.engine, self.id, self.password)
+            return hasher.rehash(password, callback)
+
+    @staticmethod
+    def update_password(engine, user_id, old_hash, new_hash):
+        # on a connection of its own: the callback may run on the request's
+        # thread, where committing or removing the scoped session would detach
+        # the user the request is still working with. Only swap the hash if the
+        # password was not changed in the meantime
+        with engine.begin() as conn:
+            conn.execute(
+                User.__table__.update()
+                .where(User.id == user_id)
+                .where(User.password == old_hash)
+                .values(password=new_hash)
+            )
+
+    @classmethod
+    def json_query(cls):
+        # select only the serialized columns as plain rows, skipping ORM hydration
+        return db.session.query(cls.id, cls.username, cls.email, cls.active)
+
+    @classmethod
+    def same_email(cls, email):
+        return func.lower(cls.email) == func.lower(email)
+
+    @classmethod
+    def same_username(cls, username):
+        return func.lower(cls.username) == func.lower(username)
+
+    @classmethod
+    def filter_query(cls, query, prefix=None, active=None, created_after=None):
+        if prefix is not None:
+            pattern = func.lower(like_prefix(prefix))
+            query = query.filter(
+                or_(
+                    func.lower(cls.username).like(pattern, escape="\\"),
+                    func.lower(cls.email).like(pattern, escape="\\"),
+                )
+            )
+        if active is not None:
+            query = query.filter(cls.active == active)
+        if created_after is not None:
+            query = query.filter(cls.created_date > created_after)
+        return query
+
+    @staticmethod
+    def row_to_json(row):
+        return {"id": row[0], "username": row[1], "email": row[2], "active": row[3]}
+
+    @classmethod
+    def get_json(cls, user_id):
+        row = cls.json_query().filter(cls.id == user_id).first()
+        return cls.row_to_json(row) if row else None
+
+    @classmethod
+    def get_json_many(cls, user_ids):
+        # one statement, with the ids sent as a single array parameter
+        ids = bindparam("ids", list(user_ids), type_=ARRAY(db.Integer))
+        rows = cls.json_query().filter(cls.id == any_(ids))
+        return {row[0]: cls.row_to_json(row) for row in rows}
+
+    @staticmethod
+    def new_session_id():
+        # shared by the access and refresh tokens of one login, so that logging
+        # out with either revokes both
+        return uuid.uuid4().hex
+
+    def encode_auth_token(self, user_id, sid=None):
+        # short-lived, and carries the profile so /auth/status needs no query
         try:
-            payload = {
-                "exp": dt.datetime.utcnow()
-                + dt.timedelta(
-                    days=current_app.config.get("TOKEN_EXPIRATION_DAYS"),
-                    seconds=current_app.config.get("TOKEN_EXPIRATION_SECONDS"),
-                ),
-                "iat": dt.datetime.utcnow(),
+            claims = {
                 "sub": user_id,
+                "type": "access",
+                "username": self.username,
+                "email": self.email,
+                "active": self.active,
             }
-            return jwt.encode(payload, current_app.config.get("SECRET_KEY"), algorithm="HS256")
+            if sid is not None:
+                claims["sid"] = sid
+            return User._encode_token(
+                claims, seconds=current_app.config.get("ACCESS_TOKEN_EXPIRATION_SECONDS")
+            )
         except Exception as e:
             return e
 
-    @staticmethod
-    def decode_auth_token(auth_token):
+    def encode_refresh_token(self, user_id, sid=None):
         try:
-            payload = jwt.decode(
-                auth_token, current_app.config.get("SECRET_KEY"), algorithms=["HS256"]
+            claims = {"sub": user_id, "type": "refresh"}
+            if sid is not None:
+                claims["sid"] = sid
+            return User._encode_token(
+                claims,
+                days=current_app.config.get("TOKEN_EXPIRATION_DAYS"),
+                seconds=current_app.config.get("TOKEN_EXPIRATION_SECONDS"),
             )
-            return payload["sub"]
-        except jwt.ExpiredSignatureError:
-            return "Signature expired. Please log in again."
-        except jwt.InvalidTokenError:
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _encode_token(claims, **lifetime):
+        now = dt.datetime.utcnow()
+        expires = now + dt.timedelta(**lifetime)
+        payload = dict(claims, exp=expires, iat=now, jti=uuid.uuid4().hex)
+        with timer("jwt", "encode"):
+            return signer.encode(payload)
+
+    @staticmethod
+    def decode_auth_token(auth_token):
+        payload = User.decode_auth_payload(auth_token)
+        if isinstance(payload, str):
+            return payload
+        return payload["sub"]
+
+    @staticmethod
+    def decode_auth_payload(auth_token, token_type="access"):
+        # token_type=None accepts both kinds; tokens issued before refresh
+        # tokens existed count as access tokens
+        payload = token_cache.get(auth_token)
+        if payload is None:
+            try:
+                with timer("jwt", "decode"):
+                    payload = signer.decode(auth_token)
+            except jwt.ExpiredSignatureError:
+                return "Signature expired. Please log in again."
+            except jwt.InvalidTokenError:
+                return "Invalid token. Please log in again."
+            token_cache.set(auth_token, payload)
+        if token_type is not None and payload.get("type", "access") != token_type:
             return "Invalid token. Please log in again."
+        if token_cache.is_revoked(payload):
+            return "Token revoked. Please log in again."
+        return payload
+
+    @staticmethod
+    def claims_to_json(payload):
+        # the user as of when the access token was issued
+        if "username" not in payload:
+            return None
+        return {
+            "id": payload["sub"],
+            "username": payload["username"],
+            "email": payload["email"],
+            "active": payload["active"],
+        }
+
+
+class RevokedToken(db.Model):  # type: ignore
+    __tablename__ = "revoked_tokens"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=dt.datetime.utcnow, nullable=False, index=True)
+
+    @classmethod
+    def revoke(cls, payload):
+        jti = payload.get("jti")
+        if jti is None:
+            return False
+        # the token itself, and its session: the other token of the pair may
+        # live as long as a refresh token issued right now
+        revoked = [(jti, payload["exp"])]
+        sid = payload.get("sid")
+        if sid is not None:
+            config = current_app.config
+            lifetime = dt.timedelta(
+                days=config.get("TOKEN_EXPIRATION_DAYS"),
+                seconds=config.get("TOKEN_EXPIRATION_SECONDS"),
+            )
+            session_exp = dt.datetime.utcnow() + lifetime
+            revoked.append((sid, calendar.timegm(session_exp.utctimetuple())))
+        now = dt.datetime.utcnow()
+        table = cls.__table__
+        rows = [
+            {"jti": key, "expires_at": dt.datetime.utcfromtimestamp(exp), "revoked_at": now}
+            for key, exp in revoked
+        ]
+        db.session.execute(insert(table).values(rows).on_conflict_do_nothing())
+        # nobody needs a revocation once its token has expired
+        db.session.execute(table.delete().where(table.c.expires_at <= now))
+        db.session.commit()
+        for key, exp in revoked:
+            denylist.add(key, exp)
+        return True
+
+    @classmethod
+    def revoked_since(cls, since=None):
+        query = db.session.query(cls.jti, cls.expires_at).filter(
+            cls.expires_at > dt.datetime.utcnow()
+        )
+        if since is not None:
+            query = query.filter(cls.revoked_at > since)
+        return [(jti, calendar.timegm(expires_at.utctimetuple())) for jti, expires_at in query]
+
+
+@token_cache.revocation_check
+def is_denied(payload):
+    return denylist.is_revoked(payload, RevokedToken.revoked_since)
+
+
+def like_prefix(value):
+    # match value literally, as a prefix
+    for char in ("\\", "%", "_"):
+        value = value.replace(char, "\\" + char)
+    return value + "%"
+
+
+def unique_violation(error):
+    # the users column whose unique constraint an IntegrityError tripped, if any
+    constraint = getattr(getattr(error.orig, "diag", None), "constraint_name", None) or ""
+    for column in ("email", "username"):
+        if column in constraint:
+            return column
+    return None
+
+
+# keep the user cache coherent with every ORM write to users
+@event.listens_for(db.session, "after_flush")
+def invalidate_flushed_users(session, flush_context):
+    user_ids = {
+        obj.id
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, User)
+    }
+    if user_ids:
+        user_cache.invalidate(user_ids)
+        session.info.setdefault("flushed_users", set()).update(user_ids)
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_committed_users(session):
+    user_ids = session.info.pop("flushed_users", None)
+    if user_ids:
+        user_cache.invalidate(user_ids)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def forget_flushed_users(session, previous_transaction):
+    session.info.pop("flushed_users", None)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+def invalidate_bulk_updated_users(update_context):
+    if update_context.mapper.class_ is User:
+        user_cache.clear()
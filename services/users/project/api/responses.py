@@ -0,0 +1,39 @@
+import hashlib
+import json
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    # compact JSON as bytes; orjson is several times faster when installed
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def content_etag(body):
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def json_response(body, status=200, etag=None):
+    response = current_app.response_class(body, status=status, mimetype="application/json")
+    if etag is not None:
+        _validate(response, etag)
+    return response
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    _validate(response, etag)
+    return response
+
+
+def _validate(response, etag):
+    # clients may keep the body, but must revalidate it before each use
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
@@ -1,17 +1,75 @@
-from flask import Blueprint, jsonify, request, render_template
+import datetime as dt
+from itertools import islice
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    json,
+    jsonify,
+    request,
+    render_template,
+    stream_with_context,
+)
 from sqlalchemy import exc
 
-from project.api.models import User
-from project import db
+from project.api.importer import (
+    UnreadableSource,
+    import_users,
+    max_import_rows,
+    read_records,
+)
+from project.api.models import User, unique_violation
+from project.api.responses import content_etag, dumps, json_response, not_modified
+from project.api.utils import service_busy
+from project import (
+    db,
+    denylist,
+    metrics,
+    rate_limiter,
+    token_cache,
+    user_cache,
+)
+from project.hashing import HashingPoolSaturated
 
 users_blueprint = Blueprint("users", __name__, template_folder="./templates")
 
+INT4_MAX = 2 ** 31 - 1
+QUERY_MAX_LENGTH = 128
+DATE_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+STREAM_MIMETYPES = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
 
 @users_blueprint.route("/users/ping", methods=["GET"])
 def ping_pong():
     return jsonify({"status": "success", "message": "pong!"})
 
 
+def _stats():
+    return {
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "db_pool": db.pool_metrics(),
+        "denylist": denylist.stats(),
+        "rate_limit": rate_limiter.stats(),
+    }
+
+
+@users_blueprint.route("/users/stats", methods=["GET"])
+def get_stats():
+    response_object = {"status": "success", "data": _stats()}
+    return jsonify(response_object), 200
+
+
+@users_blueprint.route("/users/metrics", methods=["GET"])
+def get_metrics():
+    body = metrics.render(_stats())
+    if body is None:
+        response_object = {"status": "fail", "message": "Metrics are disabled."}
+        return jsonify(response_object), 404
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
 @users_blueprint.route("/users", methods=["POST"])
 def add_user():
     post_data = request.get_json()
@@ -24,48 +82,202 @@ def add_user():
     password = post_data.get("password")
 
     try:
-        user = User.query.filter_by(email=email).first()
-        if not user:
-            db.session.add(User(username=username, email=email, password=password))
-            db.session.commit()
-            response_object = {"status": "success", "message": f"{email} was added!"}
-            return jsonify(response_object), 201
-        else:
+        db.session.add(User(username=username, email=email, password=password))
+        db.session.commit()
+        response_object = {"status": "success", "message": f"{email} was added!"}
+        return jsonify(response_object), 201
+    except exc.IntegrityError as e:
+        db.session.rollback()
+        violation = unique_violation(e)
+        # postgres reports one violated constraint; a duplicate email takes precedence
+        if violation == "email" or (
+            violation and db.session.query(User.id).filter(User.same_email(email)).first()
+        ):
             response_object["message"] = "Sorry. That email already exists."
-            return jsonify(response_object), 400
-    except (exc.IntegrityError, ValueError):
+        return jsonify(response_object), 400
+    except ValueError:
         db.session.rollback()
         return jsonify(response_object), 400
+    except HashingPoolSaturated:
+        db.session.rollback()
+        return service_busy(response_object)
+
+
+@users_blueprint.route("/users/bulk", methods=["POST"])
+def add_users_bulk():
+    response_object = {"status": "fail", "message": "Invalid payload."}
+    fmt = "csv" if request.mimetype == "text/csv" else "ndjson"
+    # read one row past the limit before inserting any, so that an oversized
+    # upload is turned away whole
+    max_rows = max_import_rows()
+    try:
+        records = list(islice(read_records(request.stream, fmt), max_rows + 1))
+    except UnreadableSource:
+        return jsonify(response_object), 400
+    if len(records) > max_rows:
+        response_object["message"] = (
+            f"Too many rows. Send at most {max_rows} at a time, "
+            "or load the file with manage.py import-users."
+        )
+        return jsonify(response_object), 413
+    report = import_users(records)
+    if not report["inserted"] and not report["failed"]:
+        return jsonify(response_object), 400
+    response_object = {"status": "success", "data": report}
+    return jsonify(response_object), 200
 
 
 @users_blueprint.route("/users/<user_id>", methods=["GET"])
 def get_single_user(user_id):
     response_object = {"status": "fail", "message": "User does not exist"}
     try:
-        user = User.query.filter_by(id=user_id).first()
+        user = user_cache.get(int(user_id), User.get_json)
         if not user:
             return jsonify(response_object), 404
-        response_object = {
-            "status": "success",
-            "data": {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "active": user.active,
-            },
-        }
-        return jsonify(response_object), 200
+        response_object = {"status": "success", "data": user}
+        # the body comes from the user cache and is small, so hashing it is
+        # cheaper than tracking a version per row
+        body = dumps(response_object)
+        etag = content_etag(body)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        return json_response(body, etag=etag)
     except (ValueError, exc.DataError):
         return jsonify(response_object), 404
 
 
 @users_blueprint.route("/users", methods=["GET"])
 def get_all_users():
+    response_object = {"status": "fail", "message": "Invalid query parameters."}
+    if "ids" in request.args:
+        return _get_users_by_id(response_object)
+    try:
+        limit = _int_arg("limit")
+        after = _int_arg("after")
+        active = _bool_arg("active")
+        created_after = _date_arg("created_after")
+    except ValueError:
+        return jsonify(response_object), 400
+    prefix = request.args.get("q") or None
+    # nothing longer than the columns can match, and Postgres rejects NUL
+    if prefix is not None and (len(prefix) > QUERY_MAX_LENGTH or "\x00" in prefix):
+        return jsonify(response_object), 400
+    if limit is not None and not 0 < limit <= current_app.config["USERS_PAGE_MAX_LIMIT"]:
+        return jsonify(response_object), 400
+    stream = request.args.get("stream")
+    if stream is not None and stream not in STREAM_MIMETYPES:
+        return jsonify(response_object), 400
+
+    # keyset pagination on the primary key
+    query = User.json_query().order_by(User.id)
+    query = User.filter_query(query, prefix, active, created_after)
+    if after is not None:
+        query = query.filter(User.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+
+    if stream:
+        return _stream_users(query, stream)
+
+    users = [User.row_to_json(row) for row in query]
+    response_object = {"status": "success", "data": {"users": users}}
+    if limit is not None:
+        response_object["data"]["next"] = users[-1]["id"] if len(users) == limit else None
+    # validated by a hash of the page itself, as a version kept by the table
+    # would have every write to users queue up behind the one updating it. A
+    # 304 therefore still reads and serializes the page; it saves the transfer
+    body = dumps(response_object)
+    etag = content_etag(body)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    return json_response(body, etag=etag)
+
+
+def _get_users_by_id(response_object):
+    # ?ids=3,1,2 resolves a set of ids in one round trip; the other query
+    # parameters do not apply
+    try:
+        ids = [int(user_id) for user_id in request.args["ids"].split(",")]
+    except ValueError:
+        return jsonify(response_object), 400
+    # keep the first occurrence of each id, in the order given
+    ids = list(dict.fromkeys(ids))
+    if not 0 < len(ids) <= current_app.config["USERS_IDS_MAX"]:
+        return jsonify(response_object), 400
+    # users.id is a 32-bit integer; postgres rejects larger values outright
+    if any(abs(user_id) > INT4_MAX for user_id in ids):
+        return jsonify(response_object), 400
+    payloads = user_cache.get_many(ids, User.get_json_many)
     response_object = {
         "status": "success",
-        "data": {"users": [user.to_json() for user in User.query.all()]},
+        "data": {
+            "users": [payloads[user_id] for user_id in ids if payloads[user_id] is not None],
+            "missing": [user_id for user_id in ids if payloads[user_id] is None],
+        },
     }
-    return jsonify(response_object), 200
+    return json_response(dumps(response_object))
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return int(value)
+
+
+def _bool_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value.lower() in ("true", "1"):
+        return True
+    if value.lower() in ("false", "0"):
+        return False
+    raise ValueError(value)
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+
+def _stream_users(query, fmt):
+    chunk_size = current_app.config["USERS_STREAM_CHUNK_SIZE"]
+    # yield_per fetches through a server-side cursor, chunk_size rows at a time
+    rows = query.yield_per(chunk_size)
+
+    def generate():
+        if fmt == "json":
+            yield '{"status": "success", "data": {"users": ['
+        separator = "\n" if fmt == "ndjson" else ","
+        chunk = []
+        first = True
+        for row in rows:
+            chunk.append(json.dumps(User.row_to_json(row)))
+            if len(chunk) == chunk_size:
+                yield _join_chunk(chunk, separator, first, fmt)
+                chunk = []
+                first = False
+        if chunk:
+            yield _join_chunk(chunk, separator, first, fmt)
+        if fmt == "json":
+            yield "]}}"
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_MIMETYPES[fmt])
+
+
+def _join_chunk(chunk, separator, first, fmt):
+    body = separator.join(chunk)
+    if fmt == "ndjson":
+        return body + separator
+    return body if first else separator + body
 
 
 @users_blueprint.route("/", methods=["GET", "POST"])
@@ -76,5 +288,5 @@ def index():
         password = request.form["password"]
         db.session.add(User(username=username, email=email, password=password))
         db.session.commit()
-    users = User.query.all()
+    users = User.json_query().order_by(User.id).all()
     return render_template("index.html", users=users)
@@ -0,0 +1,13 @@
+import math
+
+from flask import jsonify
+
+
+def service_busy(response_object):
+    response_object["message"] = "Service busy. Please try again."
+    return jsonify(response_object), 503, {"Retry-After": "1"}
+
+
+def too_many_requests(response_object, retry_after):
+    response_object["message"] = "Too many attempts. Please try again later."
+    return jsonify(response_object), 429, {"Retry-After": str(math.ceil(retry_after))}
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SharedBackend:
+    # base for caches living outside the process (memcached, redis, ...); values
+    # cross the wire as JSON, subclasses implement the raw byte operations
+    prefix = "users:"
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get_raw(self, key):
+        raise NotImplementedError
+
+    def get_many_raw(self, keys):
+        # override with the backend's multi-get to save a round trip per key
+        return [self.get_raw(key) for key in keys]
+
+    def set_raw(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete_raw(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get(self, key, default=None):
+        value = self.get_raw(f"{self.prefix}{key}")
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(value)
+
+    def get_many(self, keys):
+        values = self.get_many_raw([f"{self.prefix}{key}" for key in keys])
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(values) - hits
+        return [None if value is None else json.loads(value) for value in values]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.set_raw(f"{self.prefix}{key}", json.dumps(value), ttl)
+
+    def delete(self, key):
+        self.delete_raw(f"{self.prefix}{key}")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class FakeSharedBackend(SharedBackend):
+    # in-process stand-in for a shared cache, used by the tests
+    def __init__(self, maxsize=None, ttl=None):
+        super().__init__(maxsize, ttl)
+        self.store = {}
+
+    def get_raw(self, key):
+        entry = self.store.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def set_raw(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        self.store[key] = (expires_at, value)
+
+    def delete_raw(self, key):
+        self.store.pop(key, None)
+
+    def clear(self):
+        self.store.clear()
+
+
+class UserCache:
+    # invalidate() reaches only this process' backend unless it is shared;
+    # other workers see a write once their copy's TTL runs out
+    def __init__(self, app=None):
+        self.generation = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = import_string(app.config["USER_CACHE_BACKEND"])
+        app.extensions["user_cache"] = backend(
+            app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"]
+        )
+
+    @staticmethod
+    def _cache():
+        return current_app.extensions["user_cache"]
+
+    def get(self, user_id, load):
+        cache = self._cache()
+        payload = cache.get(user_id)
+        if payload is None:
+            generation = self.generation
+            payload = load(user_id)
+            # skip the fill if a write was seen while loading
+            if payload is not None and generation == self.generation:
+                cache.set(user_id, payload)
+        return payload
+
+    def get_many(self, user_ids, load_many):
+        # load_many takes the ids missing from the cache and returns a dict of
+        # the payloads it found
+        cache = self._cache()
+        payloads = dict(zip(user_ids, cache.get_many(user_ids)))
+        missing = [user_id for user_id, payload in payloads.items() if payload is None]
+        if missing:
+            generation = self.generation
+            loaded = load_many(missing)
+            if generation == self.generation:
+                for user_id, payload in loaded.items():
+                    cache.set(user_id, payload)
+            payloads.update(loaded)
+        return payloads
+
+    def invalidate(self, user_ids):
+        self.generation += 1
+        cache = self._cache()
+        for user_id in user_ids:
+            cache.delete(user_id)
+
+    def clear(self):
+        self.generation += 1
+        self._cache().clear()
+
+    def stats(self):
+        return self._cache().stats()
+
+
+class TokenCache:
+    def __init__(self, app=None):
+        self.revocation_hooks = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["token_cache"] = LRUCache(
+            app.config["TOKEN_CACHE_SIZE"], app.config["TOKEN_CACHE_TTL"]
+        )
+
+    @staticmethod
+    def _cache():
+        return current_app.extensions["token_cache"]
+
+    @staticmethod
+    def _key(auth_token):
+        if isinstance(auth_token, str):
+            auth_token = auth_token.encode()
+        return hashlib.sha256(auth_token).digest()
+
+    def get(self, auth_token):
+        return self._cache().get(self._key(auth_token))
+
+    def set(self, auth_token, payload):
+        # never keep a verified token past its own expiry
+        if "exp" not in payload:
+            return
+        cache = self._cache()
+        ttl = payload["exp"] - time.time()
+        if cache.ttl is not None:
+            ttl = min(ttl, cache.ttl)
+        if ttl > 0:
+            cache.set(self._key(auth_token), payload, ttl)
+
+    def revoke(self, auth_token):
+        self._cache().delete(self._key(auth_token))
+
+    def revocation_check(self, func):
+        self.revocation_hooks.append(func)
+        return func
+
+    def is_revoked(self, payload):
+        return any(hook(payload) for hook in self.revocation_hooks)
+
+    def clear(self):
+        self._cache().clear()
+
+    def stats(self):
+        return self._cache().stats()
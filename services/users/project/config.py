@@ -5,12 +5,74 @@ class BaseConfig:
     DEBUG = False
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 10))
+    SQLALCHEMY_POOL_TIMEOUT = int(os.environ.get("SQLALCHEMY_POOL_TIMEOUT", 10))
+    SQLALCHEMY_POOL_RECYCLE = int(os.environ.get("SQLALCHEMY_POOL_RECYCLE", 1800))
+    SQLALCHEMY_POOL_PRE_PING = True
+    SQLALCHEMY_STATEMENT_TIMEOUT = int(os.environ.get("SQLALCHEMY_STATEMENT_TIMEOUT", 0))
+    SQLALCHEMY_PGBOUNCER = os.environ.get("SQLALCHEMY_PGBOUNCER") == "1"
     SECRET_KEY = os.environ.get("SECRET_KEY")
     DEBUG_TB_ENABLED = False
     DEBUG_TB_INTERCEPT_REDIRECTS = False
-    BCRYPT_LOG_ROUNDS = 13
+    MIGRATIONS_ENABLED = False
+    # pin the output of `manage.py calibrate-bcrypt`; every worker must hash at
+    # the same cost, or logins keep rehashing between them
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 13))
+    # bounds for calibration, also read by gunicorn_config.py
+    BCRYPT_MIN_LOG_ROUNDS = int(os.environ.get("BCRYPT_MIN_LOG_ROUNDS", 10))
+    BCRYPT_MAX_LOG_ROUNDS = int(os.environ.get("BCRYPT_MAX_LOG_ROUNDS", 16))
+    HASHING_EXECUTOR = os.environ.get("HASHING_EXECUTOR", "thread")
+    HASHING_WORKERS = int(os.environ.get("HASHING_WORKERS", 2))
+    HASHING_QUEUE_SIZE = int(os.environ.get("HASHING_QUEUE_SIZE", 8))
+    HASHING_QUEUE_TIMEOUT = 0
+    # refresh tokens live for TOKEN_EXPIRATION_*, access tokens are short-lived
     TOKEN_EXPIRATION_DAYS = 30
     TOKEN_EXPIRATION_SECONDS = 0
+    ACCESS_TOKEN_EXPIRATION_SECONDS = 900
+    TOKEN_CACHE_SIZE = 10000
+    TOKEN_CACHE_TTL = 300
+    # HS256 signs with SECRET_KEY; RS256/RS384/RS512/PS256/... need the optional
+    # cryptography package and keys from JWT_KEY_DIR or JWT_KEYS (kid -> PEM)
+    JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
+    JWT_KEY_DIR = os.environ.get("JWT_KEY_DIR")
+    JWT_KEYS = {}  # type: dict
+    # required once more than one private key is loaded
+    JWT_SIGNING_KID = os.environ.get("JWT_SIGNING_KID")
+    JWKS_MAX_AGE = 300
+    DENYLIST_SYNC_INTERVAL = 5
+    # token buckets on /auth/login, checked before any query or hash: BURST
+    # attempts at once, then RATE more per second
+    LOGIN_RATE_LIMIT_ENABLED = os.environ.get("LOGIN_RATE_LIMIT_ENABLED", "1") == "1"
+    LOGIN_IP_RATE = 1.0
+    LOGIN_IP_BURST = 20
+    LOGIN_EMAIL_RATE = 0.1
+    LOGIN_EMAIL_BURST = 5
+    RATE_LIMIT_STORE = "project.ratelimit.MemoryBucketStore"
+    RATE_LIMIT_STORE_SIZE = 100000
+    # proxies in front of the service that append to X-Forwarded-For
+    RATE_LIMIT_PROXY_COUNT = int(os.environ.get("RATE_LIMIT_PROXY_COUNT", 0))
+    DENYLIST_SYNC_OVERLAP = 60
+    # LRUCache is per process: a write invalidates the worker that made it,
+    # while every other worker keeps serving its copy (active flag included)
+    # for up to USER_CACHE_TTL seconds. Keep the TTL short, or point
+    # USER_CACHE_BACKEND at a SharedBackend subclass to share one cache
+    USER_CACHE_BACKEND = os.environ.get("USER_CACHE_BACKEND", "project.cache.LRUCache")
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 5))
+    USERS_PAGE_MAX_LIMIT = 1000
+    USERS_IDS_MAX = 100
+    BULK_IMPORT_BATCH_SIZE = 1000
+    BULK_IMPORT_MAX_ERRORS = 1000
+    # every row of POST /users/bulk costs a bcrypt hash, so a request takes at
+    # most as many rows as the hashing workers get through in
+    # BULK_IMPORT_MAX_SECONDS, well inside GUNICORN_TIMEOUT. A non-zero
+    # BULK_IMPORT_MAX_ROWS pins the cap instead; larger files go through
+    # `manage.py import-users`
+    BULK_IMPORT_MAX_SECONDS = 10
+    BULK_IMPORT_MAX_ROWS = int(os.environ.get("BULK_IMPORT_MAX_ROWS", 0))
+    USERS_STREAM_CHUNK_SIZE = 1000
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
 
 
 class DevelopmentConfig(BaseConfig):
@@ -24,11 +86,14 @@ class TestingConfig(BaseConfig):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_TEST_URL")
+    SQLALCHEMY_STATEMENT_TIMEOUT = 10000
     BCRYPT_LOG_ROUNDS = 4
     TOKEN_EXPIRATION_DAYS = 0
     TOKEN_EXPIRATION_SECONDS = 3
+    ACCESS_TOKEN_EXPIRATION_SECONDS = 3
 
 
 class ProductionConfig(BaseConfig):
     DEBUG = False
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
+    SQLALCHEMY_STATEMENT_TIMEOUT = int(os.environ.get("SQLALCHEMY_STATEMENT_TIMEOUT", 30000))
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return conn
+
+    def metrics(self):
+        stats = self.stats
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "wait_total_ms": round(stats.wait_total * 1000, 3),
+            "wait_max_ms": round(stats.wait_max * 1000, 3),
+        }
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+        if not info.drivername.startswith("postgres"):
+            return
+        config = app.config
+        options.setdefault("poolclass", InstrumentedQueuePool)
+        options["pool_pre_ping"] = config["SQLALCHEMY_POOL_PRE_PING"]
+        timeout = config["SQLALCHEMY_STATEMENT_TIMEOUT"]
+        if config["SQLALCHEMY_PGBOUNCER"]:
+            # transaction pooling hands every transaction a different server
+            # connection and rejects startup options, so nothing may rely on
+            # session state: the timeout is set per transaction instead
+            if timeout:
+                options["execution_options"] = {"local_statement_timeout": timeout}
+        elif timeout:
+            connect_args = options.setdefault("connect_args", {})
+            connect_args["options"] = f"-c statement_timeout={int(timeout)}"
+
+    def pool_metrics(self):
+        pool = self.engine.pool
+        return pool.metrics() if isinstance(pool, InstrumentedQueuePool) else {}
+
+
+@event.listens_for(Engine, "begin")
+def set_local_statement_timeout(conn):
+    timeout = conn._execution_options.get("local_statement_timeout")
+    if timeout:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout),))
+        finally:
+            cursor.close()
@@ -0,0 +1,90 @@
+import datetime as dt
+import heapq
+import threading
+import time
+
+from flask import current_app
+
+
+class Denylist:
+    # revoked jtis held as 16 raw bytes, each dropped once its token expires
+    def __init__(self):
+        self.entries = {}
+        self.expiry = []
+        self.next_sync = 0.0
+        self.synced_at = None
+        self.lock = threading.Lock()
+
+    def add(self, jti, exp):
+        key = bytes.fromhex(jti)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = exp
+                heapq.heappush(self.expiry, (exp, key))
+
+    def __contains__(self, jti):
+        exp = self.entries.get(bytes.fromhex(jti))
+        return exp is not None and exp > time.time()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def expire(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            while self.expiry and self.expiry[0][0] <= now:
+                _, key = heapq.heappop(self.expiry)
+                self.entries.pop(key, None)
+
+
+class TokenDenylist:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["denylist"] = Denylist()
+
+    @staticmethod
+    def _denylist():
+        return current_app.extensions["denylist"]
+
+    def add(self, jti, exp):
+        self._denylist().add(jti, exp)
+
+    def is_revoked(self, payload, load):
+        # tokens issued before jti existed cannot be revoked
+        jti = payload.get("jti")
+        if jti is None:
+            return False
+        denylist = self._denylist()
+        if time.monotonic() >= denylist.next_sync:
+            self.sync(load)
+        # logging out revokes the whole session as well as the token used
+        sid = payload.get("sid")
+        return jti in denylist or (sid is not None and sid in denylist)
+
+    def sync(self, load):
+        # pick up revocations made by other processes; the overlap covers rows
+        # committed late and clock skew between hosts
+        denylist = self._denylist()
+        config = current_app.config
+        denylist.next_sync = time.monotonic() + config["DENYLIST_SYNC_INTERVAL"]
+        started = dt.datetime.utcnow()
+        since = denylist.synced_at
+        if since is not None:
+            since -= dt.timedelta(seconds=config["DENYLIST_SYNC_OVERLAP"])
+        for jti, exp in load(since):
+            denylist.add(jti, exp)
+        denylist.expire()
+        denylist.synced_at = started
+
+    def clear(self):
+        # an empty denylist that counts as freshly synced
+        denylist = Denylist()
+        denylist.synced_at = dt.datetime.utcnow()
+        denylist.next_sync = time.monotonic() + current_app.config["DENYLIST_SYNC_INTERVAL"]
+        current_app.extensions["denylist"] = denylist
+
+    def stats(self):
+        return {"size": len(self._denylist())}
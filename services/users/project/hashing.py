@@ -0,0 +1,230 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import flask_bcrypt
+from flask import current_app
+
+from project.metrics import timer
+
+
+PROBE_LOG_ROUNDS = 8
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, kind, workers, queue_size, queue_timeout):
+        self.executor = _create_executor(kind, workers)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        # blocking (batch) callers never take the last slot, so that logins
+        # and signups keep getting through while an import runs
+        self.batch_slots = threading.BoundedSemaphore(max(1, workers + queue_size - 1))
+        self.queue_timeout = queue_timeout
+        self.background = set()
+
+    def submit(self, func, *args, block=False):
+        if self.executor is None:
+            future = Future()
+            future.set_result(func(*args))
+            return future
+        if block:
+            self.batch_slots.acquire()
+            acquired = self.slots.acquire()
+        elif self.queue_timeout:
+            acquired = self.slots.acquire(timeout=self.queue_timeout)
+        else:
+            acquired = self.slots.acquire(blocking=False)
+        if not acquired:
+            raise HashingPoolSaturated()
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._release(block)
+            raise
+        future.add_done_callback(lambda _: self._release(block))
+        return future
+
+    def _release(self, block):
+        self.slots.release()
+        if block:
+            self.batch_slots.release()
+
+    def run(self, func, *args):
+        return self.submit(func, *args).result()
+
+    def shutdown(self):
+        self.wait()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def wait(self, timeout=None):
+        return wait(list(self.background), timeout=timeout)
+
+
+def _create_executor(kind, workers):
+    if kind == "inline":
+        return None
+    if kind == "thread":
+        # bcrypt releases the GIL while hashing, so threads run in parallel
+        return ThreadPoolExecutor(max_workers=workers)
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == "gevent":
+        # real OS threads whose futures can be awaited from greenlets
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+
+        return GeventThreadPoolExecutor(max_workers=workers)
+    raise ValueError(f"Unknown HASHING_EXECUTOR: {kind}")
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._dummy_hashes = {}
+        self._probe_seconds = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["hasher"] = None
+
+    def pool(self, app=None):
+        app = app or current_app._get_current_object()
+        pool = app.extensions["hasher"]
+        if pool is None:
+            # created lazily so that pre-forked workers each get their own executor
+            with self._lock:
+                pool = app.extensions["hasher"]
+                if pool is None:
+                    config = app.config
+                    pool = HashingPool(
+                        config["HASHING_EXECUTOR"],
+                        config["HASHING_WORKERS"],
+                        config["HASHING_QUEUE_SIZE"],
+                        config["HASHING_QUEUE_TIMEOUT"],
+                    )
+                    app.extensions["hasher"] = pool
+        return pool
+
+    def shutdown(self, app=None):
+        app = app or current_app._get_current_object()
+        with self._lock:
+            pool, app.extensions["hasher"] = app.extensions["hasher"], None
+        if pool is not None:
+            pool.shutdown()
+
+    def wait(self, timeout=None):
+        pool = current_app.extensions["hasher"]
+        if pool is not None:
+            pool.wait(timeout)
+
+    def generate_password_hash(self, password, rounds=None):
+        if rounds is None:
+            rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+        with timer("bcrypt", "generate"):
+            pw_hash = self.pool().run(flask_bcrypt.generate_password_hash, password, rounds)
+        return pw_hash.decode()
+
+    def generate_password_hashes(self, passwords, rounds=None):
+        # batch callers wait for free slots instead of failing fast
+        if rounds is None:
+            rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+        pool = self.pool()
+        futures = [
+            pool.submit(flask_bcrypt.generate_password_hash, password, rounds, block=True)
+            for password in passwords
+        ]
+        return [future.result().decode() for future in futures]
+
+    def check_password_hash(self, pw_hash, password):
+        with timer("bcrypt", "check"):
+            return self.pool().run(flask_bcrypt.check_password_hash, pw_hash, password)
+
+    def dummy_hash(self, rounds=None):
+        # a hash of a random password at the configured cost, to check against
+        # when there is no user, so that a miss costs as much as a wrong password
+        if rounds is None:
+            rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+        pw_hash = self._dummy_hashes.get(rounds)
+        if pw_hash is None:
+            pw_hash = self.generate_password_hash(os.urandom(16).hex(), rounds)
+            self._dummy_hashes[rounds] = pw_hash
+        return pw_hash
+
+    def seconds_per_hash(self, rounds=None):
+        # timed once per process at a low cost, then scaled to the one asked for
+        if rounds is None:
+            rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+        if self._probe_seconds is None:
+            future = self.pool().submit(time_hash, PROBE_LOG_ROUNDS, block=True)
+            self._probe_seconds = future.result()
+        return self._probe_seconds * 2 ** (rounds - PROBE_LOG_ROUNDS)
+
+    def needs_rehash(self, pw_hash):
+        # only ever upgrade: hashes above the configured cost are left alone, so
+        # that a lower setting somewhere cannot undo a raise elsewhere
+        rounds = hash_log_rounds(pw_hash)
+        return rounds is None or rounds < current_app.config.get("BCRYPT_LOG_ROUNDS")
+
+    def rehash(self, password, callback):
+        # hash at the configured cost in the background, then hand the new hash to
+        # callback, which must not rely on an app context: with the inline
+        # executor it runs on the request's thread. Skipped when the pool is
+        # saturated
+        app = current_app._get_current_object()
+        pool = self.pool(app)
+        try:
+            future = pool.submit(
+                flask_bcrypt.generate_password_hash,
+                password,
+                app.config.get("BCRYPT_LOG_ROUNDS"),
+            )
+        except HashingPoolSaturated:
+            return None
+        done = Future()
+        pool.background.add(done)
+        done.add_done_callback(pool.background.discard)
+
+        def store(future):
+            try:
+                callback(future.result().decode())
+            except Exception as e:
+                app.logger.exception("Password rehash failed")
+                done.set_exception(e)
+            else:
+                done.set_result(None)
+
+        future.add_done_callback(store)
+        return done
+
+
+def hash_log_rounds(pw_hash):
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    try:
+        return int(pw_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def time_hash(rounds, samples=1):
+    # seconds for one hash at rounds, the best of samples
+    elapsed = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        flask_bcrypt.generate_password_hash("calibration", rounds)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def calibrate_log_rounds(
+    target_ms, min_rounds=4, max_rounds=31, probe_rounds=PROBE_LOG_ROUNDS
+):
+    probe_ms = time_hash(probe_rounds, samples=3) * 1000
+    # every extra round doubles the work
+    rounds = probe_rounds + int(math.floor(math.log2(target_ms / probe_ms)))
+    return max(min_rounds, min(max_rounds, rounds))
@@ -0,0 +1,194 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# time spent in these phases is accumulated per request; the remainder of the
+# request (routing, serialization, python) is reported as "other"
+PHASES = ("db", "bcrypt", "jwt")
+OPERATIONS = frozenset(("select", "insert", "update", "delete"))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # buckets are upper bounds (le), the last slot is +Inf
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="users_"):
+        self.prefix = prefix
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self, gauges=None):
+        lines = []
+        with self._lock:
+            histograms = sorted(
+                (name, labels, h.buckets, list(h.counts), h.sum, h.count)
+                for (name, labels), h in self.histograms.items()
+            )
+        seen = set()
+        for name, labels, buckets, counts, total, count in histograms:
+            name = self.prefix + name
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total!r}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for group, values in sorted((gauges or {}).items()):
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}{group}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _registry():
+    if has_app_context():
+        return current_app.extensions.get("metrics")
+    return None
+
+
+def observe(name, value, labels=(), buckets=LATENCY_BUCKETS):
+    registry = _registry()
+    if registry is not None:
+        registry.observe(name, value, labels, buckets)
+
+
+@contextmanager
+def timer(phase, op):
+    # times a bcrypt or jwt call and charges it to the current request
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry = _registry()
+        if registry is not None:
+            elapsed = time.perf_counter() - start
+            registry.observe(f"{phase}_duration_seconds", elapsed, (("op", op),))
+            _charge(phase, elapsed)
+
+
+def _charge(phase, elapsed):
+    if has_request_context():
+        phases = g.get("_metrics_phases")
+        if phases is not None:
+            phases[phase] += elapsed
+
+
+class Metrics:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config["METRICS_ENABLED"]:
+            app.extensions["metrics"] = None
+            return
+        app.extensions["metrics"] = MetricsRegistry()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @staticmethod
+    def _start_request():
+        g._metrics_started = time.perf_counter()
+        g._metrics_phases = dict.fromkeys(PHASES, 0.0)
+        g._metrics_queries = 0
+
+    @staticmethod
+    def _finish_request(response):
+        started = g.get("_metrics_started")
+        registry = current_app.extensions["metrics"]
+        if started is None or registry is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = (("endpoint", request.endpoint or "none"),)
+        registry.observe(
+            "http_request_duration_seconds",
+            elapsed,
+            endpoint + (("method", request.method), ("status", str(response.status_code))),
+        )
+        queries = g._metrics_queries
+        registry.observe("http_request_db_queries", queries, endpoint, COUNT_BUCKETS)
+        phases = dict(g._metrics_phases)
+        phases["other"] = max(elapsed - sum(phases.values()), 0.0)
+        for phase, spent in phases.items():
+            labels = endpoint + (("phase", phase),)
+            registry.observe("http_request_phase_seconds", spent, labels)
+        return response
+
+    @staticmethod
+    def render(gauges=None):
+        registry = current_app.extensions["metrics"]
+        return registry.render(gauges) if registry is not None else None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    registry = _registry()
+    if registry is None:
+        return
+    operation = statement.lstrip().partition(" ")[0].lower()
+    if operation not in OPERATIONS:
+        operation = "other"
+    registry.observe("db_query_duration_seconds", elapsed, (("operation", operation),))
+    if has_request_context() and "_metrics_queries" in g:
+        g._metrics_queries += 1
+        g._metrics_phases["db"] += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(context):
+    # failed statements never reach after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get("metrics_query_start")
+        if starts:
+            starts.pop()
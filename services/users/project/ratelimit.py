@@ -0,0 +1,161 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+from werkzeug.utils import import_string
+
+
+class BucketStore:
+    # token buckets: take() refills a bucket for the time passed since it was
+    # last used, then removes one token; it returns 0, or the seconds until a
+    # token will be available
+    def __init__(self, maxsize=None):
+        pass
+
+    def take(self, scope, key, rate, burst, now):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBucketStore(BucketStore):
+    # buckets for this process only, updated in place; past maxsize the least
+    # recently used are dropped, which at worst hands a quiet client a full one
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.scopes = {}
+        self.lock = threading.Lock()
+
+    def take(self, scope, key, rate, burst, now):
+        with self.lock:
+            buckets = self.scopes.get(scope)
+            if buckets is None:
+                buckets = self.scopes[scope] = OrderedDict()
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [burst, now]
+                if len(buckets) > self.maxsize:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + max(0.0, now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+    def clear(self):
+        with self.lock:
+            self.scopes.clear()
+
+    def stats(self):
+        return {"size": sum(len(buckets) for buckets in self.scopes.values())}
+
+
+class SharedBucketStore(BucketStore):
+    # base for stores shared between processes (memcached, redis, ...); a
+    # bucket crosses the wire as "tokens updated" and is written back with a
+    # compare-and-set, retried when another process got there first
+    prefix = "users:bucket:"
+
+    def get_raw(self, key):
+        # returns (value or None, cas token)
+        raise NotImplementedError
+
+    def cas_raw(self, key, value, token, ttl):
+        # returns whether the value was stored
+        raise NotImplementedError
+
+    def take(self, scope, key, rate, burst, now):
+        key = f"{self.prefix}{scope}:{key}"
+        # a bucket left alone this long is full again, the same as a missing one
+        ttl = math.ceil(burst / rate)
+        while True:
+            value, token = self.get_raw(key)
+            tokens, updated = (burst, now) if value is None else map(float, value.split())
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            if self.cas_raw(key, f"{tokens - 1} {now}", token, ttl):
+                return 0.0
+
+
+class FakeSharedBucketStore(SharedBucketStore):
+    # in-process stand-in for a shared store, used by the tests
+    def __init__(self, maxsize=None):
+        self.store = {}
+        self.lock = threading.Lock()
+
+    def get_raw(self, key):
+        entry = self.store.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None, entry
+        return entry[1], entry
+
+    def cas_raw(self, key, value, token, ttl):
+        with self.lock:
+            if self.store.get(key) is not token:
+                return False
+            self.store[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        return {"size": len(self.store)}
+
+
+def client_ip(proxies=0):
+    # with proxies in front, the last address each of them appended
+    if proxies:
+        route = request.access_route
+        return route[max(0, len(route) - proxies)]
+    return request.remote_addr
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.limited = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        store = import_string(app.config["RATE_LIMIT_STORE"])
+        app.extensions["rate_limit"] = store(app.config["RATE_LIMIT_STORE_SIZE"])
+
+    @staticmethod
+    def _store():
+        return current_app.extensions["rate_limit"]
+
+    def check_login(self, email):
+        # seconds the client has to wait before trying again, or 0
+        app = current_app._get_current_object()
+        config = app.config
+        if not config["LOGIN_RATE_LIMIT_ENABLED"]:
+            return 0.0
+        store = app.extensions["rate_limit"]
+        now = time.time()
+        ip = client_ip(config["RATE_LIMIT_PROXY_COUNT"])
+        rate, burst = config["LOGIN_IP_RATE"], config["LOGIN_IP_BURST"]
+        wait = store.take("ip", ip, rate, burst, now)
+        # a throttled address does not drain the account's bucket as well
+        if not wait and isinstance(email, str):
+            rate, burst = config["LOGIN_EMAIL_RATE"], config["LOGIN_EMAIL_BURST"]
+            wait = store.take("email", email.lower(), rate, burst, now)
+        if wait:
+            self.limited += 1
+        return wait
+
+    def clear(self):
+        self._store().clear()
+
+    def stats(self):
+        return dict(self._store().stats(), limited=self.limited)
@@ -0,0 +1,126 @@
+import json
+import os
+
+import jwt
+from flask import current_app
+
+
+class KeySet:
+    # parsed once per process: signing with, and looking up, key objects is
+    # far cheaper than loading PEM on every token
+    def __init__(self, algorithm, secret=None, keys=None, signing_kid=None):
+        self.algorithm = algorithm
+        if algorithm.startswith("HS"):
+            self.signing_kid = None
+            self.signing_key = secret
+            self.verify_keys = {}
+            self.jwks = json.dumps({"keys": []})
+            return
+
+        algo = _rsa_algorithm(algorithm)
+        private, public = {}, {}
+        for kid, pem in (keys or {}).items():
+            key = algo.prepare_key(pem)
+            if hasattr(key, "private_bytes"):
+                private[kid] = key
+                key = key.public_key()
+            public[kid] = key
+        if not signing_kid:
+            # with several keys loaded the newest is not necessarily the one to
+            # sign with: verifiers may not have fetched it yet
+            if len(private) > 1:
+                raise ValueError("Set JWT_SIGNING_KID to pick one of the private keys")
+            signing_kid = next(iter(private), None)
+        if signing_kid not in private:
+            raise ValueError(f"No private key for JWT_SIGNING_KID {signing_kid!r}")
+        self.signing_kid = signing_kid
+        self.signing_key = private[signing_kid]
+        self.verify_keys = public
+        self.jwks = json.dumps(
+            {
+                "keys": [
+                    dict(json.loads(algo.to_jwk(key)), kid=kid, alg=algorithm, use="sig")
+                    for kid, key in sorted(public.items())
+                ]
+            }
+        )
+
+    def encode(self, payload):
+        headers = {"kid": self.signing_kid} if self.signing_kid else None
+        return jwt.encode(payload, self.signing_key, algorithm=self.algorithm, headers=headers)
+
+    def decode(self, token):
+        if self.signing_kid is None:
+            key = self.signing_key
+        else:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = self.verify_keys.get(kid)
+            if key is None:
+                raise jwt.InvalidTokenError(f"Unknown signing key {kid!r}")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+
+def _rsa_algorithm(algorithm):
+    try:
+        from jwt.algorithms import RSAAlgorithm
+    except ImportError:
+        RSAAlgorithm = None
+    algo = jwt.algorithms.get_default_algorithms().get(algorithm)
+    if RSAAlgorithm is None or algo is None:
+        raise RuntimeError(f"JWT_ALGORITHM {algorithm} needs the cryptography package")
+    if not isinstance(algo, RSAAlgorithm):
+        raise ValueError(f"Unsupported JWT_ALGORITHM: {algorithm}")
+    return algo
+
+
+def generate_private_key(bits=2048):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(65537, bits, default_backend())
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+def load_key_dir(path):
+    # <kid>.pem holds a private key; <kid>.pub.pem a retired, verify-only key
+    keys = {}
+    for name in sorted(os.listdir(path)):
+        for suffix in (".pub.pem", ".pem"):
+            if name.endswith(suffix):
+                with open(os.path.join(path, name)) as pem:
+                    keys[name[: -len(suffix)]] = pem.read()
+                break
+    return keys
+
+
+class TokenSigner:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        keys = dict(config["JWT_KEYS"])
+        if config["JWT_KEY_DIR"]:
+            keys.update(load_key_dir(config["JWT_KEY_DIR"]))
+        app.extensions["signer"] = KeySet(
+            config["JWT_ALGORITHM"], config.get("SECRET_KEY"), keys, config["JWT_SIGNING_KID"]
+        )
+
+    @staticmethod
+    def _keys():
+        return current_app.extensions["signer"]
+
+    def encode(self, payload):
+        return self._keys().encode(payload)
+
+    def decode(self, token):
+        return self._keys().decode(token)
+
+    def jwks(self):
+        return self._keys().jwks
@@ -0,0 +1,30 @@
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = []
+
+    @contextmanager
+    def step(self, label):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        self.timings.append((label, time.perf_counter() - start))
+
+    def report(self, stream=sys.stderr):
+        if not self.enabled:
+            return
+        for label, elapsed in self.timings:
+            stream.write(f"startup: {label:<32} {elapsed * 1000:8.2f}ms\n")
+        total = sum(elapsed for _, elapsed in self.timings)
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stream.write(
+            f"startup: {'total':<32} {total * 1000:8.2f}ms, peak RSS {peak_rss} KiB\n"
+        )
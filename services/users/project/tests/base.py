@@ -1,11 +1,23 @@
 from flask_testing import TestCase
 
-from project import create_app, db
+from project import (
+    create_app,
+    db,
+    denylist,
+    rate_limiter,
+    token_cache,
+    user_cache,
+)
+from project.tests.budget import RequestBudgets
 
 app = create_app()
+budgets = RequestBudgets()
+budgets.init_app(app)
 
 
 class BaseTestCase(TestCase):
+    budgets = budgets
+
     def create_app(self):
         app.config.from_object('project.config.TestingConfig')
         return app
@@ -13,7 +25,15 @@ class BaseTestCase(TestCase):
     def setUp(self):
         db.create_all()
         db.session.commit()
+        token_cache.clear()
+        user_cache.clear()
+        denylist.clear()
+        rate_limiter.clear()
 
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        violations, self.budgets.violations = self.budgets.violations, []
+        self.budgets.overrides = {}
+        if violations:
+            self.fail("Request budget exceeded:\n" + "\n".join(map(str, violations)))
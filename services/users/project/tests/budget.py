@@ -0,0 +1,106 @@
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+Budget = namedtuple("Budget", ["queries", "ms"])
+
+# ceilings for a single request to each endpoint; a request that needs more
+# queries than listed here is most likely an N+1 regression
+DEFAULT_BUDGET = Budget(queries=1, ms=250)
+ENDPOINT_BUDGETS = {
+    "users.ping_pong": Budget(queries=0, ms=50),
+    "users.get_stats": Budget(queries=0, ms=50),
+    "users.get_metrics": Budget(queries=0, ms=50),
+    # the duplicate-email check runs only on the error path
+    "users.add_user": Budget(queries=2, ms=250),
+    "users.add_users_bulk": Budget(queries=4, ms=1000),
+    # insert, then list the users for the page
+    "users.index": Budget(queries=2, ms=250),
+    # record the revocation and purge expired ones
+    "auth.logout_user": Budget(queries=2, ms=50),
+    "auth.get_jwks": Budget(queries=0, ms=50),
+    # answered from the access token's claims
+    "auth.get_user_status": Budget(queries=0, ms=50),
+}
+
+
+class BudgetExceeded:
+    def __init__(self, endpoint, budget, statements, elapsed_ms):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.statements = statements
+        self.elapsed_ms = elapsed_ms
+
+    def __str__(self):
+        lines = [
+            f"{self.endpoint}: {len(self.statements)} queries in {self.elapsed_ms:.1f}ms, "
+            f"budget is {self.budget.queries} queries in {self.budget.ms}ms"
+        ]
+        lines.extend(f"  {i}. {statement}" for i, statement in enumerate(self.statements, 1))
+        return "\n".join(lines)
+
+
+class RequestBudgets:
+    def __init__(self):
+        self.overrides = {}
+        self.violations = []
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._after)
+
+    def budget(self, endpoint):
+        if endpoint in self.overrides:
+            return self.overrides[endpoint]
+        return ENDPOINT_BUDGETS.get(endpoint, DEFAULT_BUDGET)
+
+    @staticmethod
+    def _start():
+        g._budget_started = time.perf_counter()
+        g._budget_statements = []
+
+    def _after(self, response):
+        endpoint = request.endpoint or "none"
+        if response.is_streamed:
+            # streamed bodies run their queries after the view returns
+            response.call_on_close(lambda: self._finish(endpoint))
+        else:
+            self._finish(endpoint)
+        return response
+
+    def _finish(self, endpoint):
+        # flask_testing keeps one app context, and so one g, for the whole test
+        started = g.pop("_budget_started", None)
+        statements = g.pop("_budget_statements", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        budget = self.budget(endpoint)
+        if len(statements) > budget.queries or elapsed_ms > budget.ms:
+            self.violations.append(BudgetExceeded(endpoint, budget, statements, elapsed_ms))
+
+
+def query_budget(endpoint, queries, ms=None):
+    # overrides one endpoint's budget for a single test
+    def decorator(test):
+        @wraps(test)
+        def wrapper(self, *args, **kwargs):
+            default = self.budgets.budget(endpoint)
+            self.budgets.overrides[endpoint] = Budget(queries, default.ms if ms is None else ms)
+            return test(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        statements = g.get("_budget_statements")
+        if statements is not None:
+            statements.append(" ".join(statement.split()))
@@ -2,9 +2,10 @@ import json
 
 from flask import current_app
 
-from project import db
+from project import db, token_cache
 from project.api.models import User
 from project.tests.base import BaseTestCase
+from project.tests.budget import query_budget
 from project.tests.utils import add_user
 
 
@@ -31,6 +32,9 @@ class TestAuthBlueprint(BaseTestCase):
     def user_status(self, token):
         return self.client.get("/auth/status", headers={"Authorization": f"Bearer {token}"})
 
+    def refresh(self, token):
+        return self.client.post("/auth/refresh", headers={"Authorization": f"Bearer {token}"})
+
     def test_user_registration(self):
         response = self.register_user("justatest", "test@test.com", "123456")
         data = json.loads(response.data.decode())
@@ -49,6 +53,14 @@ class TestAuthBlueprint(BaseTestCase):
             self.assertIn("Sorry. That user already exists", data["message"])
             self.assertIn("fail", data["status"])
 
+    def test_user_registration_duplicate_email_case(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            response = self.register_user("michael", "Test@TEST.com", "test")
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Sorry. That user already exists", data["message"])
+
     def test_user_registration_duplicate_username(self):
         add_user("test", "test@test.com", "test")
         with self.client:
@@ -115,6 +127,12 @@ class TestAuthBlueprint(BaseTestCase):
             self.assertTrue(response.content_type == "application/json")
             self.assertEqual(response.status_code, 200)
 
+    def test_registered_user_login_email_case(self):
+        with self.client:
+            add_user("test", "Test@test.com", "test")
+            response = self.login_user("test@TEST.com", "test")
+            self.assertEqual(response.status_code, 200)
+
     def test_not_registered_user_login(self):
         with self.client:
             response = self.login_user("test@test.com", "test")
@@ -135,9 +153,25 @@ class TestAuthBlueprint(BaseTestCase):
             self.assertTrue(data["message"] == "Successfully logged out.")
             self.assertEqual(response.status_code, 200)
 
+    def test_logout_revokes_token(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = self.login_user("test@test.com", "test")
+            token = json.loads(resp_login.data.decode())["auth_token"]
+            self.assertEqual(self.user_status(token).status_code, 200)
+            self.assertEqual(self.logout_user(token).status_code, 200)
+            for response in (self.user_status(token), self.logout_user(token)):
+                data = json.loads(response.data.decode())
+                self.assertEqual(data["message"], "Token revoked. Please log in again.")
+                self.assertEqual(response.status_code, 401)
+            # other sessions of the same user stay valid
+            resp_login = self.login_user("test@test.com", "test")
+            token = json.loads(resp_login.data.decode())["auth_token"]
+            self.assertEqual(self.user_status(token).status_code, 200)
+
     def test_invalid_logout_expired_token(self):
         add_user("test", "test@test.com", "test")
-        current_app.config["TOKEN_EXPIRATION_SECONDS"] = -1
+        current_app.config["ACCESS_TOKEN_EXPIRATION_SECONDS"] = -1
         with self.client:
             resp_login = self.login_user("test@test.com", "test")
 
@@ -178,3 +212,115 @@ class TestAuthBlueprint(BaseTestCase):
             self.assertTrue(data["status"] == "fail")
             self.assertTrue(data["message"] == "Invalid token. Please log in again.")
             self.assertEqual(response.status_code, 401)
+
+    def test_user_status_uses_token_cache(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = self.login_user("test@test.com", "test")
+            token = json.loads(resp_login.data.decode())["auth_token"]
+            hits = token_cache.stats()["hits"]
+
+            self.assertEqual(self.user_status(token).status_code, 200)
+            self.assertEqual(self.user_status(token).status_code, 200)
+            self.assertEqual(token_cache.stats()["hits"], hits + 1)
+
+            response = self.client.get("/users/stats")
+            data = json.loads(response.data.decode())
+            self.assertEqual(data["data"]["token_cache"]["hits"], hits + 1)
+
+    def test_user_status_revoked_token(self):
+        user = add_user("test", "test@test.com", "test")
+        hook = token_cache.revocation_check(lambda payload: payload["sub"] == user.id)
+        self.addCleanup(token_cache.revocation_hooks.remove, hook)
+        with self.client:
+            resp_login = self.login_user("test@test.com", "test")
+            token = json.loads(resp_login.data.decode())["auth_token"]
+
+            response = self.user_status(token)
+            data = json.loads(response.data.decode())
+            self.assertTrue(data["status"] == "fail")
+            self.assertTrue(data["message"] == "Token revoked. Please log in again.")
+            self.assertEqual(response.status_code, 401)
+
+    def test_refresh(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = json.loads(self.login_user("test@test.com", "test").data.decode())
+            response = self.refresh(resp_login["refresh_token"])
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(data["status"] == "success")
+            self.assertTrue(data["message"] == "Successfully refreshed.")
+            self.assertNotEqual(data["auth_token"], resp_login["auth_token"])
+            response = self.user_status(data["auth_token"])
+            self.assertEqual(response.status_code, 200)
+
+    def test_refresh_rereads_user(self):
+        user = add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = json.loads(self.login_user("test@test.com", "test").data.decode())
+            User.query.filter_by(id=user.id).update({"active": False})
+            db.session.commit()
+            # the access token keeps the claims it was issued with
+            data = json.loads(self.user_status(resp_login["auth_token"]).data.decode())
+            self.assertTrue(data["data"]["active"])
+            token = json.loads(self.refresh(resp_login["refresh_token"]).data.decode())
+            data = json.loads(self.user_status(token["auth_token"]).data.decode())
+            self.assertFalse(data["data"]["active"])
+
+    def test_token_types_are_not_interchangeable(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = json.loads(self.login_user("test@test.com", "test").data.decode())
+            for response in (
+                self.refresh(resp_login["auth_token"]),
+                self.user_status(resp_login["refresh_token"]),
+            ):
+                data = json.loads(response.data.decode())
+                self.assertTrue(data["message"] == "Invalid token. Please log in again.")
+                self.assertEqual(response.status_code, 401)
+
+    def test_refresh_revoked_token(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = json.loads(self.login_user("test@test.com", "test").data.decode())
+            self.assertEqual(self.logout_user(resp_login["refresh_token"]).status_code, 200)
+            response = self.refresh(resp_login["refresh_token"])
+            data = json.loads(response.data.decode())
+            self.assertTrue(data["message"] == "Token revoked. Please log in again.")
+            self.assertEqual(response.status_code, 401)
+
+    def test_refresh_after_logout(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            resp_login = json.loads(self.login_user("test@test.com", "test").data.decode())
+            refreshed = json.loads(self.refresh(resp_login["refresh_token"]).data.decode())
+            # logging out with the access token ends the whole session
+            self.assertEqual(self.logout_user(resp_login["auth_token"]).status_code, 200)
+            response = self.refresh(resp_login["refresh_token"])
+            data = json.loads(response.data.decode())
+            self.assertTrue(data["message"] == "Token revoked. Please log in again.")
+            self.assertEqual(response.status_code, 401)
+            # as are access tokens refreshed earlier in it
+            self.assertEqual(self.user_status(refreshed["auth_token"]).status_code, 401)
+            # other sessions of the same user are not affected
+            other = json.loads(self.login_user("test@test.com", "test").data.decode())
+            self.assertEqual(self.refresh(other["refresh_token"]).status_code, 200)
+
+    def test_invalid_refresh(self):
+        with self.client:
+            response = self.client.post("/auth/refresh")
+            data = json.loads(response.data.decode())
+            self.assertTrue(data["message"] == "Provide a valid auth token.")
+            self.assertEqual(response.status_code, 403)
+
+    @query_budget("auth.get_user_status", queries=1)
+    def test_user_status_token_without_claims(self):
+        user = add_user("test", "test@test.com", "test")
+        # issued before access tokens carried the profile
+        token = User._encode_token({"sub": user.id}, seconds=60).decode()
+        with self.client:
+            response = self.user_status(token)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(data["data"]["username"] == "test")
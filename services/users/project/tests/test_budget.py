@@ -0,0 +1,51 @@
+import unittest
+
+from project.tests.base import BaseTestCase
+from project.tests.budget import Budget, query_budget
+from project.tests.utils import add_user
+
+
+class TestRequestBudgets(BaseTestCase):
+    def take_violations(self):
+        violations, self.budgets.violations = self.budgets.violations, []
+        return violations
+
+    def test_query_budget_exceeded(self):
+        user = add_user("test", "test@test.com", "test")
+        self.budgets.overrides["users.get_single_user"] = Budget(queries=0, ms=250)
+        self.client.get(f"/users/{user.id}")
+        violations = self.take_violations()
+        self.assertEqual(len(violations), 1)
+        self.assertEqual(violations[0].endpoint, "users.get_single_user")
+        self.assertIn("FROM users WHERE users.id", violations[0].statements[0])
+        self.assertIn("1 queries", str(violations[0]))
+
+    def test_time_budget_exceeded(self):
+        self.budgets.overrides["users.ping_pong"] = Budget(queries=0, ms=-1)
+        self.client.get("/users/ping")
+        violations = self.take_violations()
+        self.assertEqual(len(violations), 1)
+        self.assertEqual(violations[0].statements, [])
+
+    def test_streamed_queries_are_counted(self):
+        add_user("test", "test@test.com", "test")
+        self.budgets.overrides["users.get_all_users"] = Budget(queries=0, ms=250)
+        response = self.client.get("/users?stream=ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"test@test.com", response.data)
+        response.close()
+        self.assertEqual(len(self.take_violations()), 1)
+
+    def test_queries_outside_requests_are_ignored(self):
+        add_user("test", "test@test.com", "test")
+        self.client.get("/users/ping")
+        add_user("test2", "test2@test.com", "test")
+        self.assertEqual(self.take_violations(), [])
+
+    @query_budget("users.get_single_user", queries=0)
+    def test_query_budget_decorator(self):
+        self.assertEqual(self.budgets.budget("users.get_single_user").queries, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
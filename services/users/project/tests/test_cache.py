@@ -0,0 +1,156 @@
+import json
+import time
+import unittest
+
+from flask import current_app
+
+from project import db, token_cache, user_cache
+from project.api.models import User
+from project.cache import FakeSharedBackend, LRUCache
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1, ttl=-1)
+        cache.set("b", 2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.stats()["size"], 1)
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.delete("a")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertIsNone(cache.get("b"))
+
+
+class TestTokenCache(BaseTestCase):
+    def test_set_get(self):
+        payload = {"sub": 1, "exp": int(time.time()) + 60}
+        token_cache.set(b"token", payload)
+        self.assertEqual(token_cache.get(b"token"), payload)
+        self.assertEqual(token_cache.get("token"), payload)
+
+    def test_expired_payload_not_cached(self):
+        token_cache.set(b"token", {"sub": 1, "exp": int(time.time()) - 1})
+        self.assertIsNone(token_cache.get(b"token"))
+
+    def test_revoke(self):
+        token_cache.set(b"token", {"sub": 1, "exp": int(time.time()) + 60})
+        token_cache.revoke(b"token")
+        self.assertIsNone(token_cache.get(b"token"))
+
+    def test_revocation_hook(self):
+        hook = token_cache.revocation_check(lambda payload: payload["sub"] == 2)
+        self.addCleanup(token_cache.revocation_hooks.remove, hook)
+        self.assertFalse(token_cache.is_revoked({"sub": 1}))
+        self.assertTrue(token_cache.is_revoked({"sub": 2}))
+
+
+class TestUserCache(BaseTestCase):
+    def get_single_user(self, user_id):
+        response = self.client.get(f"/users/{user_id}")
+        return json.loads(response.data.decode())["data"]
+
+    def test_read_through(self):
+        user = add_user("test", "test@test.com", "test")
+        loads = []
+
+        def load(user_id):
+            loads.append(user_id)
+            return User.get_json(user_id)
+
+        self.assertEqual(user_cache.get(user.id, load), user.to_json())
+        self.assertEqual(user_cache.get(user.id, load), user.to_json())
+        self.assertEqual(loads, [user.id])
+
+    def test_read_through_many(self):
+        one = add_user("one", "one@test.com", "test")
+        two = add_user("two", "two@test.com", "test")
+        loads = []
+
+        def load_many(user_ids):
+            loads.append(user_ids)
+            return User.get_json_many(user_ids)
+
+        user_cache.get(one.id, User.get_json)
+        payloads = user_cache.get_many([one.id, two.id, 999], load_many)
+        self.assertEqual(payloads, {one.id: one.to_json(), two.id: two.to_json(), 999: None})
+        user_cache.get_many([two.id], load_many)
+        self.assertEqual(loads, [[two.id, 999]])
+
+    def test_misses_are_not_cached(self):
+        self.assertIsNone(user_cache.get(999, User.get_json))
+        user = add_user("test", "test@test.com", "test")
+        self.assertIsNotNone(user_cache.get(user.id, User.get_json))
+
+    def test_update_invalidates(self):
+        user = add_user("test", "test@test.com", "test")
+        with self.client:
+            self.assertTrue(self.get_single_user(user.id)["active"])
+            user.active = False
+            db.session.commit()
+            self.assertFalse(self.get_single_user(user.id)["active"])
+
+    def test_bulk_update_invalidates(self):
+        user = add_user("test", "test@test.com", "test")
+        with self.client:
+            self.assertTrue(self.get_single_user(user.id)["active"])
+            User.query.filter_by(id=user.id).update({"active": False})
+            db.session.commit()
+            self.assertFalse(self.get_single_user(user.id)["active"])
+
+    def test_rollback_keeps_committed_value(self):
+        user = add_user("test", "test@test.com", "test")
+        with self.client:
+            user.username = "changed"
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(self.get_single_user(user.id)["username"], "test")
+
+    def test_shared_backend(self):
+        backend = FakeSharedBackend(ttl=60)
+        current_app.extensions["user_cache"], default = backend, current_app.extensions["user_cache"]
+        self.addCleanup(current_app.extensions.__setitem__, "user_cache", default)
+        user = add_user("test", "test@test.com", "test")
+
+        self.assertEqual(user_cache.get(user.id, User.get_json), user.to_json())
+        self.assertEqual(json.loads(backend.store[f"users:{user.id}"][1]), user.to_json())
+        self.assertEqual(user_cache.get(user.id, User.get_json), user.to_json())
+        self.assertEqual(backend.stats(), {"hits": 1, "misses": 1})
+        payloads = user_cache.get_many([user.id, 999], User.get_json_many)
+        self.assertEqual(payloads, {user.id: user.to_json(), 999: None})
+        self.assertEqual(backend.stats(), {"hits": 2, "misses": 2})
+
+        user.active = False
+        db.session.commit()
+        self.assertNotIn(f"users:{user.id}", backend.store)
+
+
+if __name__ == "__main__":
+    unittest.main()
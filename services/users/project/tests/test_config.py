@@ -1,5 +1,8 @@
 import os
+import subprocess
+import sys
 import unittest
+from unittest import mock
 
 from flask import current_app
 from flask_testing import TestCase
@@ -24,6 +27,7 @@ class TestDevelopmentConfig(TestCase):
         self.assertTrue(app.config["BCRYPT_LOG_ROUNDS"] == 4)
         self.assertTrue(app.config["TOKEN_EXPIRATION_DAYS"] == 30)
         self.assertTrue(app.config["TOKEN_EXPIRATION_SECONDS"] == 0)
+        self.assertTrue(app.config["ACCESS_TOKEN_EXPIRATION_SECONDS"] == 900)
 
 
 class TestingTestConfig(TestCase):
@@ -42,6 +46,7 @@ class TestingTestConfig(TestCase):
         self.assertTrue(app.config["BCRYPT_LOG_ROUNDS"] == 4)
         self.assertTrue(app.config["TOKEN_EXPIRATION_DAYS"] == 0)
         self.assertTrue(app.config["TOKEN_EXPIRATION_SECONDS"] == 3)
+        self.assertTrue(app.config["ACCESS_TOKEN_EXPIRATION_SECONDS"] == 3)
 
 
 class TestProductionConfig(TestCase):
@@ -56,6 +61,53 @@ class TestProductionConfig(TestCase):
         self.assertTrue(app.config["BCRYPT_LOG_ROUNDS"] == 13)
         self.assertTrue(app.config["TOKEN_EXPIRATION_DAYS"] == 30)
         self.assertTrue(app.config["TOKEN_EXPIRATION_SECONDS"] == 0)
+        self.assertTrue(app.config["ACCESS_TOKEN_EXPIRATION_SECONDS"] == 900)
+
+
+class TestExtensionLoading(unittest.TestCase):
+    def create_app(self, config, script_info=None):
+        with mock.patch.dict(os.environ, {"APP_SETTINGS": f"project.config.{config}"}):
+            return create_app(script_info)
+
+    def test_production_skips_dev_extensions(self):
+        app = self.create_app("ProductionConfig")
+        self.assertNotIn("migrate", app.extensions)
+        self.assertNotIn("_debug_toolbar.static", app.view_functions)
+
+    def test_development_loads_toolbar(self):
+        app = self.create_app("DevelopmentConfig")
+        self.assertIn("_debug_toolbar.static", app.view_functions)
+
+    def test_cli_loads_migrate(self):
+        app = self.create_app("ProductionConfig", script_info=object())
+        self.assertIn("migrate", app.extensions)
+
+
+class TestGunicornConfig(unittest.TestCase):
+    def test_calibrated_rounds_reach_the_app(self):
+        # gunicorn loads its config in the master, before the workers import
+        # the app; a fresh interpreter stands in for that order
+        script = (
+            "import os, runpy; runpy.run_path('gunicorn_config.py'); "
+            "from project import create_app; app = create_app(); "
+            "print(os.environ['BCRYPT_LOG_ROUNDS'], app.config['BCRYPT_LOG_ROUNDS'])"
+        )
+        env = dict(
+            os.environ,
+            APP_SETTINGS="project.config.ProductionConfig",
+            BCRYPT_TARGET_MS="0.001",
+            BCRYPT_MIN_LOG_ROUNDS="5",
+        )
+        env.pop("BCRYPT_LOG_ROUNDS", None)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=root,
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        self.assertEqual(output.split(), [b"5", b"5"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,40 @@
+import json
+import unittest
+
+from project import db
+from project.database import InstrumentedQueuePool
+from project.tests.base import BaseTestCase
+
+
+class TestDatabase(BaseTestCase):
+    def test_instrumented_pool(self):
+        self.assertIsInstance(db.engine.pool, InstrumentedQueuePool)
+        checkouts = db.pool_metrics()["checkouts"]
+        with db.engine.connect() as conn:
+            conn.execute("SELECT 1")
+        metrics = db.pool_metrics()
+        self.assertEqual(metrics["checkouts"], checkouts + 1)
+        self.assertEqual(metrics["timeouts"], 0)
+        self.assertGreaterEqual(metrics["wait_max_ms"], 0)
+
+    def test_statement_timeout(self):
+        with db.engine.connect() as conn:
+            self.assertEqual(conn.execute("SHOW statement_timeout").scalar(), "10s")
+
+    def test_local_statement_timeout(self):
+        with db.engine.connect() as conn:
+            conn = conn.execution_options(local_statement_timeout=1234)
+            with conn.begin():
+                self.assertEqual(conn.execute("SHOW statement_timeout").scalar(), "1234ms")
+            # SET LOCAL ends with the transaction
+            self.assertEqual(conn.execute("SHOW statement_timeout").scalar(), "10s")
+
+    def test_pool_metrics_exposed(self):
+        response = self.client.get("/users/stats")
+        data = json.loads(response.data.decode())
+        self.assertIn("checkouts", data["data"]["db_pool"])
+        self.assertIn("wait_total_ms", data["data"]["db_pool"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import datetime as dt
+import time
+import unittest
+import uuid
+
+from project import db, denylist
+from project.api.models import RevokedToken, User
+from project.denylist import Denylist
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user
+
+
+def payload(exp_in=60):
+    return {"sub": 1, "jti": uuid.uuid4().hex, "exp": int(time.time()) + exp_in}
+
+
+class TestDenylistEntries(unittest.TestCase):
+    def test_add_and_expire(self):
+        entries = Denylist()
+        live, stale = payload(), payload(-1)
+        entries.add(live["jti"], live["exp"])
+        entries.add(stale["jti"], stale["exp"])
+        self.assertIn(live["jti"], entries)
+        self.assertNotIn(stale["jti"], entries)
+        self.assertNotIn(uuid.uuid4().hex, entries)
+        entries.expire()
+        self.assertEqual(len(entries), 1)
+
+
+class TestTokenDenylist(BaseTestCase):
+    def test_encode_auth_token_adds_jti(self):
+        user = add_user("test", "test@test.com", "test")
+        first = User.decode_auth_payload(user.encode_auth_token(user.id))
+        second = User.decode_auth_payload(user.encode_auth_token(user.id))
+        self.assertEqual(len(first["jti"]), 32)
+        self.assertNotEqual(first["jti"], second["jti"])
+
+    def test_token_without_jti_is_not_revoked(self):
+        self.assertFalse(RevokedToken.revoke({"sub": 1, "exp": int(time.time()) + 60}))
+        self.assertFalse(denylist.is_revoked({"sub": 1}, RevokedToken.revoked_since))
+
+    def test_revoke_persists(self):
+        token = payload()
+        self.assertTrue(RevokedToken.revoke(token))
+        self.assertTrue(denylist.is_revoked(token, RevokedToken.revoked_since))
+        self.assertEqual([row[0] for row in RevokedToken.revoked_since()], [token["jti"]])
+        # a restarted process loads the revocation back from postgres
+        denylist.clear()
+        denylist.sync(RevokedToken.revoked_since)
+        self.assertTrue(denylist.is_revoked(token, RevokedToken.revoked_since))
+
+    def test_sync_picks_up_other_processes(self):
+        token = payload()
+        db.session.add(
+            RevokedToken(
+                jti=token["jti"],
+                expires_at=dt.datetime.utcfromtimestamp(token["exp"]),
+                revoked_at=dt.datetime.utcnow(),
+            )
+        )
+        db.session.commit()
+        # not seen until the next sync is due
+        self.assertFalse(denylist.is_revoked(token, RevokedToken.revoked_since))
+        self.app.extensions["denylist"].next_sync = 0
+        self.assertTrue(denylist.is_revoked(token, RevokedToken.revoked_since))
+
+    def test_expired_revocations_are_purged(self):
+        stale = payload(-1)
+        db.session.add(
+            RevokedToken(
+                jti=stale["jti"],
+                expires_at=dt.datetime.utcfromtimestamp(stale["exp"]),
+                revoked_at=dt.datetime.utcnow(),
+            )
+        )
+        db.session.commit()
+        RevokedToken.revoke(payload())
+        self.assertEqual(RevokedToken.query.filter_by(jti=stale["jti"]).count(), 0)
+        self.assertEqual(denylist.stats()["size"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import importlib.util
+import json
+import threading
+import unittest
+from unittest import mock
+
+from flask import current_app
+
+from project import db, hasher
+from project.api.models import User
+from project.api.importer import max_import_rows
+from project.hashing import (
+    HashingPool,
+    HashingPoolSaturated,
+    calibrate_log_rounds,
+    hash_log_rounds,
+)
+from project.tests.base import BaseTestCase
+from project.tests.budget import query_budget
+from project.tests.utils import add_user
+
+
+class TestPasswordHasher(BaseTestCase):
+    def tearDown(self):
+        hasher.shutdown()
+        super().tearDown()
+
+    def saturate(self):
+        pool = hasher.pool()
+        acquired = 0
+        while pool.slots.acquire(blocking=False):
+            acquired += 1
+        self.addCleanup(lambda: [pool.slots.release() for _ in range(acquired)])
+
+    def test_generate_and_check(self):
+        pw_hash = hasher.generate_password_hash("greaterthaneight")
+        self.assertTrue(pw_hash.startswith("$2b$04$"))
+        self.assertTrue(hasher.check_password_hash(pw_hash, "greaterthaneight"))
+        self.assertFalse(hasher.check_password_hash(pw_hash, "lessthaneight"))
+
+    def test_empty_password(self):
+        self.assertRaises(ValueError, hasher.generate_password_hash, "")
+
+    def test_inline_executor(self):
+        current_app.config["HASHING_EXECUTOR"] = "inline"
+        self.assertIsNone(hasher.pool().executor)
+        pw_hash = hasher.generate_password_hash("greaterthaneight")
+        self.assertTrue(hasher.check_password_hash(pw_hash, "greaterthaneight"))
+
+    def test_process_executor(self):
+        current_app.config["HASHING_EXECUTOR"] = "process"
+        pw_hash = hasher.generate_password_hash("greaterthaneight")
+        self.assertTrue(hasher.check_password_hash(pw_hash, "greaterthaneight"))
+
+    @unittest.skipUnless(importlib.util.find_spec("gevent"), "gevent is not installed")
+    def test_gevent_executor(self):
+        current_app.config["HASHING_EXECUTOR"] = "gevent"
+        pw_hash = hasher.generate_password_hash("greaterthaneight")
+        self.assertTrue(hasher.check_password_hash(pw_hash, "greaterthaneight"))
+
+    def test_saturated_pool(self):
+        self.saturate()
+        self.assertRaises(HashingPoolSaturated, hasher.generate_password_hash, "test")
+
+    def test_batches_leave_a_slot_free(self):
+        pool = HashingPool("thread", workers=1, queue_size=1, queue_timeout=0)
+        release = threading.Event()
+        try:
+            pool.submit(release.wait, block=True)
+            # the batch caller would now wait for a slot; anyone else gets one
+            self.assertFalse(pool.batch_slots.acquire(blocking=False))
+            future = pool.submit(hash_log_rounds, "$2b$04$")
+            self.assertRaises(HashingPoolSaturated, pool.submit, hash_log_rounds, "")
+        finally:
+            release.set()
+            pool.shutdown()
+        self.assertEqual(future.result(), 4)
+
+    def test_seconds_per_hash(self):
+        seconds = hasher.seconds_per_hash(8)
+        self.assertGreater(seconds, 0)
+        self.assertEqual(hasher.seconds_per_hash(10), seconds * 4)
+
+    def test_max_import_rows(self):
+        current_app.config.update(HASHING_WORKERS=2, BULK_IMPORT_MAX_SECONDS=2)
+        with mock.patch.object(hasher, "seconds_per_hash", return_value=0.5):
+            self.assertEqual(max_import_rows(), 8)
+            hasher.seconds_per_hash.return_value = 10 ** 6
+            self.assertEqual(max_import_rows(), 1)
+        current_app.config["BULK_IMPORT_MAX_ROWS"] = 3
+        self.assertEqual(max_import_rows(), 3)
+
+    def test_saturated_pool_register(self):
+        self.saturate()
+        with self.client:
+            response = self.client.post(
+                "/auth/register",
+                data=json.dumps(
+                    {"username": "test", "email": "test@test.com", "password": "test"}
+                ),
+                content_type="application/json",
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "1")
+            self.assertIn("Service busy", data["message"])
+            self.assertIn("fail", data["status"])
+
+    def test_saturated_pool_login(self):
+        add_user("test", "test@test.com", "test")
+        self.saturate()
+        with self.client:
+            response = self.client.post(
+                "/auth/login",
+                data=json.dumps({"email": "test@test.com", "password": "test"}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("Service busy", data["message"])
+            self.assertIn("fail", data["status"])
+
+    def test_dummy_hash(self):
+        pw_hash = hasher.dummy_hash()
+        self.assertEqual(hash_log_rounds(pw_hash), 4)
+        self.assertIs(hasher.dummy_hash(), pw_hash)
+        current_app.config["BCRYPT_LOG_ROUNDS"] = 5
+        self.assertEqual(hash_log_rounds(hasher.dummy_hash()), 5)
+        self.assertIs(hasher.dummy_hash(4), pw_hash)
+
+    def test_unknown_email_login_checks_a_hash(self):
+        with self.client, mock.patch.object(
+            hasher, "check_password_hash", wraps=hasher.check_password_hash
+        ) as check:
+            for password in ("test", "", None, 123):
+                response = self.client.post(
+                    "/auth/login",
+                    data=json.dumps({"email": "test@test.com", "password": password}),
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 404)
+            self.assertEqual(check.call_count, 4)
+            self.assertEqual(check.call_args[0][0], hasher.dummy_hash())
+
+    def test_login_with_non_string_password(self):
+        add_user("test", "test@test.com", "test")
+        with self.client:
+            for email in ("test@test.com", "nobody@test.com"):
+                response = self.client.post(
+                    "/auth/login",
+                    data=json.dumps({"email": email, "password": 123}),
+                    content_type="application/json",
+                )
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 404)
+                self.assertIn("User does not exist.", data["message"])
+
+    def test_hash_log_rounds(self):
+        self.assertEqual(hash_log_rounds(hasher.generate_password_hash("test", 5)), 5)
+        self.assertIsNone(hash_log_rounds("not a bcrypt hash"))
+        self.assertIsNone(hash_log_rounds(None))
+
+    def test_calibrate_log_rounds(self):
+        self.assertEqual(calibrate_log_rounds(0.001, min_rounds=4, max_rounds=16), 4)
+        self.assertEqual(calibrate_log_rounds(10 ** 9, min_rounds=4, max_rounds=16), 16)
+        fast = calibrate_log_rounds(10, min_rounds=4, max_rounds=31)
+        slow = calibrate_log_rounds(1000, min_rounds=4, max_rounds=31)
+        self.assertGreater(slow, fast)
+
+    def test_needs_rehash(self):
+        pw_hash = hasher.generate_password_hash("test")
+        self.assertFalse(hasher.needs_rehash(pw_hash))
+        current_app.config["BCRYPT_LOG_ROUNDS"] = 5
+        self.assertTrue(hasher.needs_rehash(pw_hash))
+        # never downgrade a hash made at a higher cost
+        self.assertFalse(hasher.needs_rehash(hasher.generate_password_hash("test", 6)))
+        self.assertTrue(hasher.needs_rehash("not a bcrypt hash"))
+
+    def test_login_rehashes_password(self):
+        user = add_user("test", "test@test.com", "test")
+        current_app.config["BCRYPT_LOG_ROUNDS"] = 5
+        with self.client:
+            response = self.client.post(
+                "/auth/login",
+                data=json.dumps({"email": "test@test.com", "password": "test"}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+        hasher.wait(timeout=5)
+        db.session.expire_all()
+        user = User.query.get(user.id)
+        self.assertEqual(hash_log_rounds(user.password), 5)
+        self.assertTrue(hasher.check_password_hash(user.password, "test"))
+
+    @query_budget("auth.login_user", queries=2)
+    def test_inline_login_rehashes_password(self):
+        # the rehash completes on the request's thread, before the token is made
+        current_app.config["HASHING_EXECUTOR"] = "inline"
+        user = add_user("test", "test@test.com", "test")
+        current_app.config["BCRYPT_LOG_ROUNDS"] = 5
+        with self.client:
+            response = self.client.post(
+                "/auth/login",
+                data=json.dumps({"email": "test@test.com", "password": "test"}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(data["auth_token"])
+        db.session.expire_all()
+        self.assertEqual(hash_log_rounds(User.query.get(user.id).password), 5)
+
+    def test_rehash_skips_changed_password(self):
+        user = add_user("test", "test@test.com", "test")
+        old_hash = user.password
+        user.password = hasher.generate_password_hash("changed")
+        db.session.commit()
+        new_hash = hasher.generate_password_hash("test")
+        User.update_password(db.engine, user.id, old_hash, new_hash)
+        db.session.expire_all()
+        self.assertTrue(hasher.check_password_hash(User.query.get(user.id).password, "changed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import unittest
+
+from flask import current_app
+
+from project.metrics import Histogram, MetricsRegistry
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user
+
+
+def sample(body, line):
+    for row in body.splitlines():
+        if row.startswith(line + " "):
+            return float(row.rsplit(" ", 1)[1])
+    return 0.0
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_histogram_buckets(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_render(self):
+        registry = MetricsRegistry()
+        registry.observe("op_seconds", 0.5, (("op", "a"),), buckets=(0.1, 1.0))
+        body = registry.render({"cache": {"hits": 3, "name": "skip"}})
+        self.assertIn("# TYPE users_op_seconds histogram", body)
+        self.assertIn('users_op_seconds_bucket{op="a",le="0.1"} 0', body)
+        self.assertIn('users_op_seconds_bucket{op="a",le="1.0"} 1', body)
+        self.assertIn('users_op_seconds_bucket{op="a",le="+Inf"} 1', body)
+        self.assertIn('users_op_seconds_count{op="a"} 1', body)
+        self.assertIn("users_cache_hits 3", body)
+        self.assertNotIn("users_cache_name", body)
+
+
+class TestMetricsEndpoint(BaseTestCase):
+    def metrics(self):
+        response = self.client.get("/users/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("text/plain", response.content_type)
+        return response.data.decode()
+
+    def test_request_and_query_metrics(self):
+        user = add_user("test", "test@test.com", "test")
+        before = self.metrics()
+        count = 'users_http_request_duration_seconds_count{endpoint="users.get_single_user",' \
+            'method="GET",status="200"}'
+        queries = 'users_http_request_db_queries_count{endpoint="users.get_single_user"}'
+        self.client.get(f"/users/{user.id}")
+        body = self.metrics()
+        self.assertEqual(sample(body, count), sample(before, count) + 1)
+        self.assertEqual(sample(body, queries), sample(before, queries) + 1)
+        select = 'users_db_query_duration_seconds_count{operation="select"}'
+        self.assertGreater(sample(body, select), sample(before, select))
+        self.assertIn("users_db_pool_checkouts", body)
+        self.assertIn("users_user_cache_hits", body)
+
+    def test_bcrypt_and_jwt_metrics(self):
+        add_user("test", "test@test.com", "test")
+        before = self.metrics()
+        response = self.client.post(
+            "/auth/login",
+            data=json.dumps({"email": "test@test.com", "password": "test"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        body = self.metrics()
+        for line, count in (
+            ('users_bcrypt_duration_seconds_count{op="check"}', 1),
+            # an access and a refresh token
+            ('users_jwt_duration_seconds_count{op="encode"}', 2),
+            ('users_http_request_phase_seconds_count{endpoint="auth.login_user",phase="bcrypt"}', 1),
+            ('users_http_request_phase_seconds_count{endpoint="auth.login_user",phase="other"}', 1),
+        ):
+            self.assertEqual(sample(body, line), sample(before, line) + count, line)
+
+    def test_metrics_disabled(self):
+        current_app.extensions["metrics"], registry = None, current_app.extensions["metrics"]
+        try:
+            response = self.client.get("/users/metrics")
+        finally:
+            current_app.extensions["metrics"] = registry
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
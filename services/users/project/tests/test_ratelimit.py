@@ -0,0 +1,153 @@
+import json
+import tracemalloc
+import unittest
+from itertools import repeat
+
+from flask import current_app
+
+from project import rate_limiter, ratelimit
+from project.ratelimit import FakeSharedBucketStore, MemoryBucketStore
+from project.tests.base import BaseTestCase
+from project.tests.budget import query_budget
+from project.tests.utils import add_user
+
+
+class BucketStoreTests:
+    def make_store(self):
+        raise NotImplementedError
+
+    def test_burst_then_refill(self):
+        store = self.make_store()
+        for _ in range(3):
+            self.assertEqual(store.take("ip", "a", 0.5, 3, 100.0), 0)
+        self.assertAlmostEqual(store.take("ip", "a", 0.5, 3, 100.0), 2.0)
+        # other keys and scopes have their own buckets
+        self.assertEqual(store.take("ip", "b", 0.5, 3, 100.0), 0)
+        self.assertEqual(store.take("email", "a", 0.5, 3, 100.0), 0)
+        self.assertAlmostEqual(store.take("ip", "a", 0.5, 3, 101.0), 1.0)
+        self.assertEqual(store.take("ip", "a", 0.5, 3, 102.0), 0)
+        self.assertGreater(store.take("ip", "a", 0.5, 3, 102.0), 0)
+
+    def test_refill_is_capped_at_burst(self):
+        store = self.make_store()
+        store.take("ip", "a", 1.0, 2, 100.0)
+        for _ in range(2):
+            self.assertEqual(store.take("ip", "a", 1.0, 2, 1000.0), 0)
+        self.assertGreater(store.take("ip", "a", 1.0, 2, 1000.0), 0)
+
+    def test_clear(self):
+        store = self.make_store()
+        store.take("ip", "a", 1.0, 1, 100.0)
+        store.clear()
+        self.assertEqual(store.take("ip", "a", 1.0, 1, 100.0), 0)
+
+
+class TestMemoryBucketStore(BucketStoreTests, unittest.TestCase):
+    def make_store(self):
+        return MemoryBucketStore()
+
+    def test_least_recently_used_are_dropped(self):
+        store = MemoryBucketStore(maxsize=2)
+        for key in ("a", "b", "a", "c"):
+            store.take("ip", key, 1.0, 1, 100.0)
+        self.assertEqual(store.stats(), {"size": 2})
+        self.assertGreater(store.take("ip", "a", 1.0, 1, 100.0), 0)
+        self.assertEqual(store.take("ip", "b", 1.0, 1, 100.0), 0)
+
+    def test_known_key_does_not_allocate(self):
+        store = MemoryBucketStore()
+        store.take("ip", "a", 1.0, 1000000, 100.0)
+        # only count what the store allocates, not the rest of the process
+        only_store = [tracemalloc.Filter(True, ratelimit.__file__)]
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot().filter_traces(only_store)
+            for _ in repeat(None, 1000):
+                store.take("ip", "a", 1.0, 1000000, 100.0)
+            after = tracemalloc.take_snapshot().filter_traces(only_store)
+        finally:
+            tracemalloc.stop()
+        growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        self.assertEqual(growth, 0)
+
+
+class TestFakeSharedBucketStore(BucketStoreTests, unittest.TestCase):
+    def make_store(self):
+        return FakeSharedBucketStore()
+
+    def test_lost_race_is_retried(self):
+        store = FakeSharedBucketStore()
+        get_raw = store.get_raw
+        calls = []
+
+        def racing_get_raw(key):
+            value, token = get_raw(key)
+            if not calls:
+                # another process takes a token between our read and write
+                calls.append(key)
+                store.store[key] = (float("inf"), "1.0 100.0")
+            return value, token
+
+        store.get_raw = racing_get_raw
+        self.assertEqual(store.take("ip", "a", 1.0, 2, 100.0), 0)
+        self.assertEqual(store.store["users:bucket:ip:a"][1], "0.0 100.0")
+
+
+class TestLoginRateLimit(BaseTestCase):
+    def login(self, email, password="wrong", headers=None):
+        return self.client.post(
+            "/auth/login",
+            data=json.dumps({"email": email, "password": password}),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_email_limit(self):
+        add_user("test", "test@test.com", "test")
+        current_app.config["LOGIN_EMAIL_BURST"] = 2
+        with self.client:
+            self.assertEqual(self.login("test@test.com").status_code, 404)
+            self.assertEqual(self.login("TEST@test.com").status_code, 404)
+            response = self.login("test@test.com", "test")
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "10")
+            self.assertIn("Too many attempts", data["message"])
+            self.assertEqual(self.login("other@test.com").status_code, 404)
+        self.assertGreaterEqual(rate_limiter.stats()["limited"], 1)
+
+    def test_ip_limit(self):
+        current_app.config["LOGIN_IP_BURST"] = 2
+        with self.client:
+            for email in ("one@test.com", "two@test.com"):
+                self.assertEqual(self.login(email).status_code, 404)
+            self.assertEqual(self.login("three@test.com").status_code, 429)
+
+    @query_budget("auth.login_user", queries=0)
+    def test_limited_before_any_query(self):
+        add_user("test", "test@test.com", "test")
+        current_app.config["LOGIN_EMAIL_BURST"] = 0
+        with self.client:
+            self.assertEqual(self.login("test@test.com", "test").status_code, 429)
+
+    def test_forwarded_for(self):
+        current_app.config["LOGIN_IP_BURST"] = 1
+        current_app.config["RATE_LIMIT_PROXY_COUNT"] = 1
+        with self.client:
+            # the client controls everything left of what the proxy appended
+            headers = {"X-Forwarded-For": "10.0.0.1, 192.168.0.1"}
+            self.assertEqual(self.login("one@test.com", headers=headers).status_code, 404)
+            headers = {"X-Forwarded-For": "10.0.0.2, 192.168.0.1"}
+            self.assertEqual(self.login("two@test.com", headers=headers).status_code, 429)
+            headers = {"X-Forwarded-For": "192.168.0.2"}
+            self.assertEqual(self.login("three@test.com", headers=headers).status_code, 404)
+
+    def test_disabled(self):
+        current_app.config["LOGIN_RATE_LIMIT_ENABLED"] = False
+        current_app.config["LOGIN_IP_BURST"] = 0
+        with self.client:
+            self.assertEqual(self.login("test@test.com").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import json
+import unittest
+
+import jwt
+
+from project import signer, token_cache
+from project.api.models import User
+from project.signing import KeySet
+from project.tests.base import BaseTestCase
+from project.tests.utils import add_user
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from jwt.algorithms import RSAAlgorithm
+
+    from project.signing import generate_private_key
+except ImportError:
+    RSAAlgorithm = None
+
+
+class TestHS256Signing(BaseTestCase):
+    def test_default_is_hs256(self):
+        user = add_user("test", "test@test.com", "test")
+        token = user.encode_auth_token(user.id)
+        self.assertEqual(jwt.get_unverified_header(token)["alg"], "HS256")
+        self.assertNotIn("kid", jwt.get_unverified_header(token))
+        self.assertEqual(User.decode_auth_token(token), user.id)
+
+    def test_jwks_is_empty(self):
+        response = self.client.get("/auth/jwks")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode()), {"keys": []})
+
+
+@unittest.skipUnless(RSAAlgorithm, "cryptography is not installed")
+class TestRS256Signing(BaseTestCase):
+    keys = {}
+
+    @classmethod
+    def setUpClass(cls):
+        # key generation is slow, so share two keys across the tests
+        cls.keys = {"k1": generate_private_key(), "k2": generate_private_key()}
+
+    def use_keys(self, keys, signing_kid=None):
+        self.configure_signer("RS256", keys, signing_kid)
+        self.addCleanup(self.configure_signer, "HS256", {}, None)
+
+    def configure_signer(self, algorithm, keys, signing_kid):
+        self.app.config["JWT_ALGORITHM"] = algorithm
+        self.app.config["JWT_KEYS"] = keys
+        self.app.config["JWT_SIGNING_KID"] = signing_kid
+        # keys change with a restart, which also empties the token cache
+        signer.init_app(self.app)
+        token_cache.clear()
+
+    def test_sign_with_kid(self):
+        self.use_keys(self.keys, "k1")
+        user = add_user("test", "test@test.com", "test")
+        token = user.encode_auth_token(user.id)
+        header = jwt.get_unverified_header(token)
+        self.assertEqual(header["alg"], "RS256")
+        self.assertEqual(header["kid"], "k1")
+        self.assertEqual(User.decode_auth_token(token), user.id)
+
+    def public_pem(self, kid):
+        key = RSAAlgorithm(RSAAlgorithm.SHA256).prepare_key(self.keys[kid]).public_key()
+        return key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+
+    def test_only_private_key_signs_by_default(self):
+        self.use_keys({"k1": self.public_pem("k1"), "k2": self.keys["k2"]})
+        self.assertEqual(self.app.extensions["signer"].signing_kid, "k2")
+
+    def test_signing_kid_required_with_several_private_keys(self):
+        with self.assertRaises(ValueError):
+            KeySet("RS256", keys=self.keys)
+
+    def test_rotation(self):
+        self.use_keys(self.keys, "k1")
+        user = add_user("test", "test@test.com", "test")
+        old_token = user.encode_auth_token(user.id)
+        # k2 takes over signing; k1 stays around, public part only, to verify
+        self.use_keys({"k1": self.public_pem("k1"), "k2": self.keys["k2"]}, "k2")
+        new_token = user.encode_auth_token(user.id)
+        self.assertEqual(jwt.get_unverified_header(new_token)["kid"], "k2")
+        self.assertEqual(User.decode_auth_token(old_token), user.id)
+        self.assertEqual(User.decode_auth_token(new_token), user.id)
+        # and once k1 is retired its tokens are rejected
+        self.use_keys({"k2": self.keys["k2"]})
+        self.assertEqual(
+            User.decode_auth_token(old_token), "Invalid token. Please log in again."
+        )
+
+    def test_hs256_token_rejected(self):
+        user = add_user("test", "test@test.com", "test")
+        token = user.encode_auth_token(user.id)
+        self.use_keys(self.keys, "k1")
+        self.assertEqual(User.decode_auth_token(token), "Invalid token. Please log in again.")
+
+    def test_jwks(self):
+        self.use_keys(self.keys, "k1")
+        user = add_user("test", "test@test.com", "test")
+        token = user.encode_auth_token(user.id)
+        response = self.client.get("/auth/jwks")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=300", response.headers["Cache-Control"])
+        keys = json.loads(response.data.decode())["keys"]
+        self.assertEqual([key["kid"] for key in keys], ["k1", "k2"])
+        self.assertTrue(all("d" not in key for key in keys))
+        # what another service does with the published key
+        public_key = RSAAlgorithm.from_jwk(json.dumps(keys[0]))
+        payload = jwt.decode(token, public_key, algorithms=["RS256"])
+        self.assertEqual(payload["sub"], user.id)
+
+    def test_verification_keys_are_memoized(self):
+        keys = KeySet("RS256", keys=self.keys, signing_kid="k2")
+        verify_key = keys.verify_keys["k2"]
+        keys.decode(keys.encode({"sub": 1}))
+        self.assertIs(keys.verify_keys["k2"], verify_key)
+
+    def test_missing_signing_key(self):
+        with self.assertRaises(ValueError):
+            KeySet("RS256", keys=self.keys, signing_kid="k3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 
 from project import db
-from project.api.models import User
+from project.api.models import User, unique_violation
 from project.tests.base import BaseTestCase
 from project.tests.utils import add_user
 
@@ -29,10 +29,36 @@ class TestUserModel(BaseTestCase):
         db.session.add(duplicate_user)
         self.assertRaises(IntegrityError, db.session.commit)
 
+    def test_unique_violation(self):
+        add_user("justatest", "test@test.com", "greaterthaneight")
+        for duplicate, column in (
+            (User("justatest", "test@test2.com", "greaterthaneight"), "username"),
+            (User("justanothertest", "test@test.com", "greaterthaneight"), "email"),
+            # uniqueness ignores case
+            (User("JustATest", "test@test3.com", "greaterthaneight"), "username"),
+            (User("justanothertest", "Test@Test.com", "greaterthaneight"), "email"),
+        ):
+            db.session.add(duplicate)
+            with self.assertRaises(IntegrityError) as context:
+                db.session.commit()
+            db.session.rollback()
+            self.assertEqual(unique_violation(context.exception), column)
+
+    def test_same_email(self):
+        user = add_user("justatest", "Test@Test.com", "greaterthaneight")
+        self.assertEqual(User.query.filter(User.same_email("test@TEST.com")).first(), user)
+        self.assertEqual(User.query.filter(User.same_username("JUSTATEST")).first(), user)
+        self.assertIsNone(User.query.filter(User.same_email("test@test.co")).first())
+
     def test_to_json(self):
         user = add_user("justatest", "test@test.com", "greaterthaneight")
         self.assertTrue(isinstance(user.to_json(), dict))
 
+    def test_json_query(self):
+        user = add_user("justatest", "test@test.com", "greaterthaneight")
+        row = User.json_query().filter(User.id == user.id).first()
+        self.assertEqual(User.row_to_json(row), user.to_json())
+
     def test_passwords_are_random(self):
         user_one = add_user("justatest", "test@test1.com", "greaterthaneight")
         user_two = add_user("justatest2", "test@test2.com", "greaterthaneight")
@@ -1,10 +1,26 @@
+import datetime as dt
 import json
 import unittest
 
+from flask import current_app
+
+from project import db, hasher, user_cache
+from project.api.importer import copy_users, synthetic_users
+from project.api.models import User
 from project.tests.base import BaseTestCase
+from project.tests.budget import query_budget
 from project.tests.utils import add_user
 
 
+def explain(query):
+    # the plan the query would get on a table too big to just scan
+    statement = query.statement.compile(dialect=db.engine.dialect)
+    connection = db.session.connection()
+    connection.execute("SET LOCAL enable_seqscan = off")
+    rows = connection.execute("EXPLAIN " + str(statement), statement.params)
+    return "\n".join(row[0] for row in rows)
+
+
 class TestUserService(BaseTestCase):
     def test_users(self):
         response = self.client.get("/users/ping")
@@ -102,6 +118,166 @@ class TestUserService(BaseTestCase):
             self.assertIn("Sorry. That email already exists.", data["message"])
             self.assertIn("fail", data["status"])
 
+    def test_add_user_duplicate_email_case(self):
+        add_user("michael", "michael@mherman.org", "greaterthaneight")
+        with self.client:
+            response = self.client.post(
+                "/users",
+                data=json.dumps(
+                    {
+                        "username": "Michael",
+                        "email": "Michael@MHerman.org",
+                        "password": "greaterthaneight",
+                    }
+                ),
+                content_type="application/json",
+            )
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Sorry. That email already exists.", data["message"])
+
+    def test_add_users_bulk_ndjson(self):
+        add_user("michael", "michael@mherman.org", "greaterthaneight")
+        lines = [
+            json.dumps({"username": "fletcher", "email": "fletcher@notreal.com", "password": "a"}),
+            json.dumps({"username": "michael", "email": "michael@mherman.org", "password": "a"}),
+            "{not json",
+            "",
+            json.dumps({"username": "eugene", "email": "eugene@notreal.com"}),
+            json.dumps({"username": "eugene", "email": "eugene@notreal.com", "password": "a"}),
+            json.dumps({"username": "eugene", "email": "eugene@notreal.com", "password": "a"}),
+        ]
+        with self.client:
+            response = self.client.post(
+                "/users/bulk", data="\n".join(lines), content_type="application/x-ndjson"
+            )
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("success", data["status"])
+            self.assertEqual(data["data"]["inserted"], 2)
+            self.assertEqual(data["data"]["failed"], 4)
+            self.assertEqual(
+                data["data"]["errors"],
+                [
+                    {"line": 3, "message": "Invalid JSON."},
+                    {"line": 5, "message": "Invalid payload."},
+                    {"line": 2, "message": "Sorry. That user already exists."},
+                    {"line": 7, "message": "Sorry. That user already exists."},
+                ],
+            )
+
+            response = self.client.get("/users")
+            data = json.loads(response.data.decode())
+            self.assertEqual(len(data["data"]["users"]), 3)
+            self.assertIn("fletcher", data["data"]["users"][1]["username"])
+            self.assertIn("eugene", data["data"]["users"][2]["username"])
+
+    def test_add_users_bulk_csv(self):
+        body = "username,email,password\nfletcher,fletcher@notreal.com,a\neugene,,a\n"
+        with self.client:
+            response = self.client.post("/users/bulk", data=body, content_type="text/csv")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data["data"]["inserted"], 1)
+            self.assertEqual(data["data"]["errors"], [{"line": 3, "message": "Invalid payload."}])
+
+    def test_add_users_bulk_too_many_rows(self):
+        current_app.config["BULK_IMPORT_MAX_ROWS"] = 2
+        body = "username,email,password\n" + "".join(
+            f"user{i},user{i}@notreal.com,a\n" for i in range(3)
+        )
+        with self.client:
+            response = self.client.post("/users/bulk", data=body, content_type="text/csv")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 413)
+            self.assertIn("Too many rows", data["message"])
+            self.assertIn("fail", data["status"])
+            self.assertEqual(User.query.count(), 0)
+
+            body = body.split("user2")[0]
+            response = self.client.post("/users/bulk", data=body, content_type="text/csv")
+            self.assertEqual(response.status_code, 200)
+
+    def test_add_users_bulk_nul(self):
+        lines = [
+            json.dumps({"username": "fletcher", "email": "fletcher@notreal.com", "password": "a"}),
+            json.dumps({"username": "eu\x00gene", "email": "eugene@notreal.com", "password": "a"}),
+        ]
+        with self.client:
+            response = self.client.post(
+                "/users/bulk", data="\n".join(lines), content_type="application/x-ndjson"
+            )
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data["data"]["inserted"], 1)
+            self.assertEqual(data["data"]["errors"], [{"line": 2, "message": "Invalid payload."}])
+
+    def test_add_users_bulk_unreadable(self):
+        for body, content_type in (
+            (b'{"username": "\xff"}\n', "application/x-ndjson"),
+            (b"username,email,password\nfletcher,\xff,a\n", "text/csv"),
+            (b"username,email,password\nfletcher,a\x00b,a\n", "text/csv"),
+        ):
+            with self.client:
+                response = self.client.post("/users/bulk", data=body, content_type=content_type)
+                data = json.loads(response.data.decode())
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("Invalid payload.", data["message"])
+        self.assertEqual(User.query.count(), 0)
+
+    def test_add_users_bulk_empty(self):
+        with self.client:
+            response = self.client.post(
+                "/users/bulk", data="", content_type="application/x-ndjson"
+            )
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Invalid payload.", data["message"])
+            self.assertIn("fail", data["status"])
+
+    def test_copy_synthetic_users(self):
+        password_hash = hasher.generate_password_hash("greaterthaneight")
+        self.assertEqual(copy_users(synthetic_users(3, password_hash, start=5)), 3)
+        with self.client:
+            response = self.client.get("/users")
+            users = json.loads(response.data.decode())["data"]["users"]
+            self.assertEqual([user["username"] for user in users], ["user5", "user6", "user7"])
+            self.assertEqual(users[0]["email"], "user5@example.com")
+            self.assertTrue(all(user["active"] for user in users))
+            response = self.client.post(
+                "/auth/login",
+                data=json.dumps({"email": "user7@example.com", "password": "greaterthaneight"}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_add_user_duplicate_username(self):
+        add_user("michael", "michael@mherman.org", "greaterthaneight")
+        with self.client:
+            response = self.client.post(
+                "/users",
+                data=json.dumps(
+                    {
+                        "username": "michael",
+                        "email": "michael@notreal.com",
+                        "password": "greaterthaneight",
+                    }
+                ),
+                content_type="application/json",
+            )
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Invalid payload.", data["message"])
+            self.assertIn("fail", data["status"])
+
     def test_single_user(self):
         user = add_user("michael", "michael@mherman.org", "greaterthaneight")
 
@@ -132,6 +308,27 @@ class TestUserService(BaseTestCase):
             self.assertIn("User does not exist", data["message"])
             self.assertIn("fail", data["status"])
 
+    def test_single_user_etag(self):
+        user = add_user("michael", "michael@mherman.org", "greaterthaneight")
+
+        with self.client:
+            response = self.client.get(f"/users/{user.id}")
+            etag = response.headers["ETag"]
+            self.assertTrue(etag.startswith('W/"'))
+            self.assertEqual(response.headers["Cache-Control"], "no-cache")
+
+            response = self.client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+
+            user.active = False
+            db.session.commit()
+            response = self.client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(json.loads(response.data.decode())["data"]["active"])
+            self.assertNotEqual(response.headers["ETag"], etag)
+
     def test_all_users(self):
         add_user("michael", "michael@herman.org", "greaterthaneight")
         add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
@@ -148,6 +345,232 @@ class TestUserService(BaseTestCase):
             self.assertIn("fletcher@notreal.com", data["data"]["users"][1]["email"])
             self.assertIn("success", data["status"])
 
+    def test_all_users_paginated(self):
+        add_user("michael", "michael@herman.org", "greaterthaneight")
+        fletcher = add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+        add_user("eugene", "eugene@notreal.com", "greaterthaneight")
+
+        with self.client:
+            response = self.client.get("/users?limit=2")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(data["data"]["users"]), 2)
+            self.assertEqual(data["data"]["next"], fletcher.id)
+
+            response = self.client.get(f"/users?limit=2&after={data['data']['next']}")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(data["data"]["users"]), 1)
+            self.assertIn("eugene", data["data"]["users"][0]["username"])
+            self.assertIsNone(data["data"]["next"])
+
+    def test_all_users_etag(self):
+        add_user("michael", "michael@herman.org", "greaterthaneight")
+
+        with self.client:
+            response = self.client.get("/users")
+            etag = response.headers["ETag"]
+            self.assertTrue(etag.startswith('W/"'))
+            self.assertEqual(response.headers["Cache-Control"], "no-cache")
+
+            response = self.client.get("/users", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+
+            # any change to the rows on the page changes the tag
+            add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+            response = self.client.get("/users", headers={"If-None-Match": etag})
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(data["data"]["users"]), 2)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+            User.query.filter_by(username="fletcher").delete()
+            db.session.commit()
+            self.assertEqual(self.client.get("/users").headers["ETag"], etag)
+            User.query.filter_by(username="michael").update({"active": False})
+            db.session.commit()
+            self.assertNotEqual(self.client.get("/users").headers["ETag"], etag)
+
+            # each page is validated on its own
+            page = self.client.get("/users?limit=1").headers["ETag"]
+            self.assertNotEqual(page, self.client.get("/users").headers["ETag"])
+
+    def test_concurrent_inserts_do_not_block(self):
+        # the ETag needs no bookkeeping row that every writer has to lock
+        first = db.engine.connect()
+        second = db.engine.connect()
+        transaction = first.begin()
+        try:
+            first.execute(
+                User.__table__.insert().values(
+                    username="one", email="one@test.com", password="x", active=True
+                )
+            )
+            with second.begin():
+                second.execute("SET LOCAL lock_timeout = '1s'")
+                second.execute(
+                    User.__table__.insert().values(
+                        username="two", email="two@test.com", password="x", active=True
+                    )
+                )
+        finally:
+            transaction.rollback()
+            first.close()
+            second.close()
+        self.assertEqual([user.username for user in User.query], ["two"])
+
+    def test_all_users_search(self):
+        add_user("michael", "michael@herman.org", "greaterthaneight")
+        add_user("fletcher", "mike@notreal.com", "greaterthaneight")
+        add_user("mi_chael", "eugene@notreal.com", "greaterthaneight")
+
+        with self.client:
+            for q, usernames in (
+                ("mi", ["michael", "fletcher", "mi_chael"]),
+                ("mic", ["michael"]),
+                ("MIC", ["michael"]),
+                ("mi_", ["mi_chael"]),
+                ("mi%", []),
+                ("eugene@", ["mi_chael"]),
+            ):
+                response = self.client.get(f"/users?q={q}")
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([user["username"] for user in data["data"]["users"]], usernames)
+
+    def test_all_users_filters(self):
+        michael = add_user("michael", "michael@herman.org", "greaterthaneight")
+        fletcher = add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+        fletcher.active = False
+        michael.created_date = dt.datetime(2018, 1, 1)
+        db.session.commit()
+
+        with self.client:
+            for query, usernames in (
+                ("active=false", ["fletcher"]),
+                ("active=true", ["michael"]),
+                ("created_after=2018-06-01", ["fletcher"]),
+                ("created_after=2017-12-31T23:59:59", ["michael", "fletcher"]),
+                ("active=true&created_after=2018-06-01", []),
+                ("q=fl&active=false&limit=1", ["fletcher"]),
+            ):
+                response = self.client.get(f"/users?{query}")
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([user["username"] for user in data["data"]["users"]], usernames)
+
+    def test_all_users_filter_plans(self):
+        for filters, index in (
+            ({"prefix": "Mich"}, "ix_users_username_lower"),
+            ({"prefix": "Mich"}, "ix_users_email_lower"),
+            ({"active": False}, "ix_users_inactive"),
+            ({"created_after": dt.datetime(2018, 1, 1)}, "ix_users_created_date"),
+        ):
+            plan = explain(User.filter_query(User.json_query(), **filters))
+            self.assertIn(index, plan)
+            self.assertNotIn("Seq Scan", plan)
+        # the login and duplicate checks
+        for criterion, index in (
+            (User.same_email("Michael@Herman.org"), "ix_users_email_lower"),
+            (User.same_username("Michael"), "ix_users_username_lower"),
+        ):
+            plan = explain(User.query.filter(criterion))
+            self.assertIn(index, plan)
+            self.assertNotIn("Seq Scan", plan)
+
+    @query_budget("users.get_all_users", queries=1)
+    def test_users_by_ids(self):
+        michael = add_user("michael", "michael@herman.org", "greaterthaneight")
+        fletcher = add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+
+        with self.client:
+            response = self.client.get(f"/users?ids={fletcher.id},999,{michael.id},{fletcher.id}")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data["data"]["users"], [fletcher.to_json(), michael.to_json()])
+            self.assertEqual(data["data"]["missing"], [999])
+            self.assertIn("success", data["status"])
+
+    @query_budget("users.get_all_users", queries=0)
+    def test_users_by_ids_cached(self):
+        michael = add_user("michael", "michael@herman.org", "greaterthaneight")
+        fletcher = add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+        user_cache.get_many([michael.id, fletcher.id], User.get_json_many)
+
+        with self.client:
+            response = self.client.get(f"/users?ids={michael.id},{fletcher.id}")
+            data = json.loads(response.data.decode())
+            self.assertEqual([user["id"] for user in data["data"]["users"]], [michael.id, fletcher.id])
+
+    def test_users_by_ids_invalid(self):
+        with self.client:
+            for ids in ("", "1,,2", "blah", "99999999999", ",".join(map(str, range(101)))):
+                response = self.client.get(f"/users?ids={ids}")
+                data = json.loads(response.data.decode())
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("Invalid query parameters.", data["message"])
+
+    def test_all_users_invalid_limit(self):
+        with self.client:
+            for query in (
+                "limit=blah",
+                "limit=0",
+                "limit=100000",
+                "after=blah",
+                "active=blah",
+                "created_after=blah",
+                "q=a%00b",
+                "q=a%00b&stream=json",
+                "q=" + "a" * 129,
+            ):
+                response = self.client.get(f"/users?{query}")
+                data = json.loads(response.data.decode())
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("Invalid query parameters.", data["message"])
+                self.assertIn("fail", data["status"])
+
+    def test_all_users_stream_json(self):
+        add_user("michael", "michael@herman.org", "greaterthaneight")
+        add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+
+        with self.client:
+            response = self.client.get("/users?stream=json")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(data["data"]["users"]), 2)
+            self.assertIn("michael", data["data"]["users"][0]["username"])
+            self.assertIn("fletcher", data["data"]["users"][1]["username"])
+            self.assertIn("success", data["status"])
+
+    def test_all_users_stream_ndjson(self):
+        add_user("michael", "michael@herman.org", "greaterthaneight")
+        add_user("fletcher", "fletcher@notreal.com", "greaterthaneight")
+
+        with self.client:
+            response = self.client.get("/users?stream=ndjson")
+            lines = response.data.decode().splitlines()
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content_type, "application/x-ndjson")
+            self.assertEqual(len(lines), 2)
+            self.assertIn("michael", json.loads(lines[0])["username"])
+            self.assertIn("fletcher", json.loads(lines[1])["username"])
+
+    def test_all_users_stream_empty(self):
+        with self.client:
+            response = self.client.get("/users?stream=json")
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data["data"]["users"], [])
+
     def test_main_no_users(self):
         response = self.client.get("/")
         self.assertEqual(response.status_code, 200)